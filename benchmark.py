@@ -0,0 +1,312 @@
+"""
+Description: Benchmark suite for the Chinese words and roots toolkit
+
+Generates synthetic CC-CEDICT files and synthetic tagged treebanks, times the toolkit on them
+and writes the results as JSON. Runs offline; no corpus or dictionary download is needed.
+
+(Unix terminal examples)
+    python benchmark.py --scales 10000 100000 --output bench.json
+    python benchmark.py --scales 10000 100000 --compare bench.json
+"""
+
+import argparse, itertools, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+
+import chinese_roots
+
+#Sinica Treebank-style POS tags
+TAGS = ['Na', 'Nb', 'Nba', 'Nbc', 'Nc', 'Nd', 'Nh', 'VA', 'VC', 'VH', 'VK', 'D', 'Dj', 'P', 'Caa', 'DE', 'Neu', 'Nf']
+
+#glosses for synthetic entries; some carry the markers CDict classifies (see chinese_roots.FLAG_MARKERS)
+GLOSSES = ['to build', 'to establish', 'house', 'language', 'to study', 'good', 'old', 'big', 'water',
+    'to make', 'person', 'country', 'mountain', 'to go', 'heart', 'to see']
+MARKED_GLOSSES = ['(idiom) to disappear without trace', 'variant of 建[jian4]', 'old variant of 造[zao4]',
+    'surname Li', 'CL:個|个[ge4]', 'Korean gugja', '(slang) awesome', 'abbr. for 中國|中国[Zhong1 guo2]']
+SYLLABLES = ['jian', 'zao', 'yu', 'yan', 'xue', 'hao', 'li', 'zhong', 'guo', 'ren', 'shan', 'shui', 'da', 'xiao']
+
+def get_char_pool(rng, size=8000):
+    """
+    Returns (chars, cum_weights): CJK characters with cumulative Zipf-like weights, so some roots are very productive
+    """
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + size)]
+    rng.shuffle(chars)
+    return chars, get_zipf_cum_weights(size)
+
+def get_zipf_cum_weights(size):
+    """
+    Returns cumulative Zipf weights for rng.choices(cum_weights=...), which then draws in O(log size)
+    instead of summing the weights on every call
+    """
+    return list(itertools.accumulate(1.0 / (rank + 1) for rank in range(size)))
+
+def make_word(rng, chars, cum_weights, lengths=(1, 2, 2, 2, 2, 3, 3, 4, 4, 5)):
+    """
+    Returns a random word of Zipf-distributed characters
+    """
+    return ''.join(rng.choices(chars, cum_weights=cum_weights, k=rng.choice(lengths)))
+
+def write_synthetic_cedict(path, n_entries, seed=0):
+    """
+    Write a synthetic CC-CEDICT .u8 file.
+
+    String path: path of destination file
+    int n_entries: number of dictionary lines
+    int seed: random seed; the same seed and size always give the same file
+    """
+    rng = random.Random(seed)
+    chars, cum_weights = get_char_pool(rng)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('# CC-CEDICT\n# Synthetic dictionary for benchmarking\n')
+        for n in range(n_entries):
+            #start with every character on its own, like the real dictionary
+            word = chars[n] if n < len(chars) // 2 else make_word(rng, chars, cum_weights)
+            pinyin = ' '.join(rng.choice(SYLLABLES) + str(rng.randint(1, 5)) for char in word)
+            glosses = rng.sample(GLOSSES, rng.randint(1, 3))
+            if rng.random() < 0.15:
+                glosses.insert(0, rng.choice(MARKED_GLOSSES))
+            f.write('{0} {0} [{1}] /{2}/\n'.format(word, pinyin, '/'.join(glosses)))
+
+class SyntheticTreebank:
+    """
+    In-memory stand-in for NLTK's Sinica Treebank reader, with random tagged sentences.
+
+    Has the words(), tagged_words(), sents() and tagged_sents() methods SinicaPOS and SinicaVec use.
+    """
+
+    def __init__(self, n_tokens, vocab_size=None, seed=0):
+        """
+        int n_tokens: approximate number of word tokens
+        int vocab_size: number of word types to draw from; defaults to n_tokens // 10
+        int seed: random seed
+        """
+        rng = random.Random(seed)
+        chars, cum_weights = get_char_pool(rng)
+        vocab_size = vocab_size or max(n_tokens // 10, 100)
+        vocab = [(make_word(rng, chars, cum_weights, lengths=(1, 1, 2, 2, 2, 3)), rng.choice(TAGS)) \
+            for n in range(vocab_size)]
+        vocab_cum_weights = get_zipf_cum_weights(vocab_size)
+
+        self.tagged_sentences = []
+        n = 0
+        while n < n_tokens:
+            sent = rng.choices(vocab, cum_weights=vocab_cum_weights, k=rng.randint(4, 20))
+            self.tagged_sentences.append(sent)
+            n += len(sent)
+
+    def tagged_sents(self):
+        return self.tagged_sentences
+
+    def sents(self):
+        return [[word for word, tag in sent] for sent in self.tagged_sentences]
+
+    def tagged_words(self):
+        return [pair for sent in self.tagged_sentences for pair in sent]
+
+    def words(self):
+        return [word for sent in self.tagged_sentences for word, tag in sent]
+
+def time_it(func, repeat):
+    """
+    Run func repeat times.
+
+    Return type: dict of format {'min':seconds, 'median':seconds, 'repeat':repeat}
+    """
+    times = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min':min(times), 'median':statistics.median(times), 'repeat':repeat}
+
+def bench_cdict(scale, tmp_dir, repeat, results):
+    """
+    Time CC-CEDICT conversion, CDict loading, the three search forms, batch and definition search, get_idioms and get_nonrare
+
+    Searches are timed with the result cache off, so every repeat does the search; cdict.search.cached
+    times the same queries answered from a warm cache.
+    """
+    txt = os.path.join(tmp_dir, 'cedict_{0}.u8'.format(scale))
+    csv_path = os.path.join(tmp_dir, 'cedict_{0}.csv'.format(scale))
+    write_synthetic_cedict(txt, scale)
+
+    results['cdict.from_txt'] = time_it(lambda: chinese_roots.CDict.from_txt(txt, csv_path), 1)
+    results['cdict.load'] = time_it(lambda: chinese_roots.CDict(csv_path), repeat)
+    cdict = chinese_roots.CDict(csv_path, result_cache_size=0)
+    snapshot = os.path.join(tmp_dir, 'cedict_{0}.snap'.format(scale))
+    results['cdict.save_snapshot'] = time_it(lambda: cdict.save_snapshot(snapshot), 1)
+    results['cdict.load_snapshot'] = time_it(lambda: chinese_roots.CDict.load_snapshot(snapshot), repeat)
+
+    #the same 200 characters for every form, drawn from the dictionary itself
+    rng = random.Random(1)
+    queries = rng.sample(cdict.hanzi, min(200, len(cdict.hanzi)))
+    for form, pattern in (('prefix', '{0}*'), ('suffix', '*{0}'), ('infix', '*{0}*')):
+        results['cdict.search.' + form] = time_it(lambda: [cdict.search(pattern.format(query)) \
+            for query in queries], repeat)
+    cached = chinese_roots.CDict(csv_path, result_cache_size=len(queries))
+    cached.search_many(['{0}*'.format(query) for query in queries])
+    results['cdict.search.cached'] = time_it(lambda: [cached.search('{0}*'.format(query)) for query in queries], repeat)
+    batch = [pattern.format(query) for query in queries for pattern in ('{0}*', '*{0}', '*{0}*')] * 5
+    results['cdict.search_many'] = time_it(lambda: cdict.search_many(batch), repeat)
+    results['cdict.definition_index'] = time_it(lambda: chinese_roots.DefinitionIndex(cdict.word_dict), 1)
+    glosses = [gloss.split()[-1] for gloss in GLOSSES] + ['"to build"', 'house OR mountain']
+    #built on first use; timed above, so it is kept out of the search timings
+    cdict.get_definition_index()
+    results['cdict.search_definitions'] = time_it(lambda: [cdict.search_definitions(gloss) for gloss in glosses], repeat)
+    results['cdict.get_idioms'] = time_it(cdict.get_idioms, repeat)
+    results['cdict.get_nonrare'] = time_it(cdict.get_nonrare, repeat)
+
+def bench_pos(scale, repeat, results):
+    """
+    Time SinicaPOS construction, building its indexes (from a reader and streamed) and the dict builders
+    """
+    treebank = SyntheticTreebank(scale)
+
+    def build():
+        pos = chinese_roots.SinicaPOS(treebank)
+        pos.build_indexes()
+        return pos
+
+    results['pos.init'] = time_it(lambda: chinese_roots.SinicaPOS(treebank), repeat)
+    results['pos.build'] = time_it(build, repeat)
+
+    def stream():
+        pos = chinese_roots.SinicaPOS()
+        pos.add_tagged_sents(iter(treebank.tagged_sents()))
+        return pos.productivity_list
+
+    results['pos.add_tagged_sents'] = time_it(stream, repeat)
+    pos = build()
+    results['pos.get_wordtag_dict'] = time_it(pos.get_wordtag_dict, repeat)
+    results['pos.get_tagword_dict'] = time_it(pos.get_tagword_dict, repeat)
+    results['pos.get_words_by_tag'] = time_it(lambda: [pos.get_words_by_tag(tag) for tag in TAGS], repeat)
+    results['pos.get_productivity_list'] = time_it(pos.get_productivity_list, repeat)
+
+    def sketch():
+        productivity = chinese_roots.ProductivitySketch()
+        productivity.add_tagged_sents(treebank.tagged_sents())
+        return productivity.get_top(100)
+
+    results['pos.productivity_sketch'] = time_it(sketch, repeat)
+
+def bench_vec(scale, repeat, results):
+    """
+    Time Word2Vec training, whole-vocabulary similarity ranking and online updates in SinicaVec
+
+    Similarity lists are timed with the result cache off; the .cached row times them from a warm cache.
+    """
+    treebank = SyntheticTreebank(scale)
+    results['vec.train'] = time_it(lambda: chinese_roots.SinicaVec(treebank, seed=1, workers=1), 1)
+    vec = chinese_roots.SinicaVec(treebank, seed=1, workers=1, result_cache_size=0)
+
+    def rank():
+        vec.avg_similarities = None
+        vec.get_most_similar(5)
+
+    results['vec.get_most_similar'] = time_it(rank, repeat)
+
+    #200 vocabulary words, one similarity list each, uncached and then from a warm cache
+    words = random.Random(1).sample(vec.model.wv.index_to_key, min(200, len(vec.model.wv.index_to_key)))
+    results['vec.get_compound_similarity_list'] = time_it(lambda: [vec.get_compound_similarity_list(word) \
+        for word in words], repeat)
+    cached = chinese_roots.SinicaVec(treebank, seed=1, workers=1, result_cache_size=len(words))
+    cached.get_compound_similarity_lists(words)
+    results['vec.get_compound_similarity_list.cached'] = time_it(lambda: \
+        [cached.get_compound_similarity_list(word) for word in words], repeat)
+
+    #a tenth more text, so the update touches part of the vocabulary
+    extra = SyntheticTreebank(max(scale // 10, 100), seed=1).sents()
+    results['vec.update'] = time_it(lambda: vec.update(extra, workers=1), 1)
+
+def bench_import(repeat, results):
+    """
+    Time a fresh interpreter importing chinese_roots for CDict only, and with the SinicaVec dependencies.
+
+    Each run starts a new process, so nothing is already imported; Python's own startup
+    is timed separately so it can be subtracted.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    commands = {'import.python':'pass',
+        'import.cdict':'import chinese_roots; chinese_roots.CDict',
+        'import.full':'import chinese_roots; chinese_roots.np; chinese_roots.Word2Vec; chinese_roots.sinica'}
+    for name, command in commands.items():
+        results[name] = time_it(lambda: subprocess.run([sys.executable, '-c', command], cwd=package_dir, check=True), \
+            repeat)
+
+def run(scales, sections, repeat):
+    """
+    Run the selected benchmark sections at every scale.
+
+    Return type: dict of format {'meta':{...}, 'results':{'name[scale]':timings}}
+    """
+    results = {}
+    if 'import' in sections:
+        bench_import(repeat, results)
+        for name, timings in results.items():
+            print('{0:40} {1:10.4f}s'.format(name, timings['median']), file=sys.stderr)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            scale_results = {}
+            if 'cdict' in sections:
+                bench_cdict(scale, tmp_dir, repeat, scale_results)
+            if 'pos' in sections:
+                bench_pos(scale, repeat, scale_results)
+            if 'vec' in sections:
+                bench_vec(scale, repeat, scale_results)
+            for name, timings in scale_results.items():
+                results['{0}[{1}]'.format(name, scale)] = timings
+                print('{0:40} {1:10.4f}s'.format('{0}[{1}]'.format(name, scale), timings['median']), file=sys.stderr)
+    meta = {'python':platform.python_version(), 'platform':platform.platform(), 'time':time.time()}
+    return {'meta':meta, 'results':results}
+
+def compare(current, baseline, threshold, min_delta):
+    """
+    Returns list of format [(name, baseline time, current time)] for benchmarks that got slower
+
+    dict current, baseline: results of run()
+    float threshold: allowed slowdown, e.g. 0.2 means up to 20% slower is not a regression
+    float min_delta: slowdowns smaller than this many seconds are timer noise, not regressions
+
+    The fastest run of each benchmark is compared, since it is the least affected by other load.
+    """
+    regressions = []
+    for name, timings in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['min']
+        after = timings['min']
+        if after > before * (1 + threshold) and after - before > min_delta:
+            regressions.append((name, before, after))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Chinese words and roots toolkit on synthetic data.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000],
+        help='number of dictionary entries / corpus tokens to generate, e.g. 10000 100000 1000000')
+    parser.add_argument('--sections', nargs='+', default=['import', 'cdict', 'pos', 'vec'],
+        choices=['import', 'cdict', 'pos', 'vec'])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the fastest is compared')
+    parser.add_argument('--output', help='write results to this JSON file (default: stdout)')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before flagging (0.2 = 20%%)')
+    parser.add_argument('--min-delta', type=float, default=0.005, help='ignore slowdowns under this many seconds')
+    args = parser.parse_args(argv)
+
+    current = run(args.scales, args.sections, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    elif not args.compare:
+        json.dump(current, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold, args.min_delta)
+        for name, before, after in regressions:
+            print('REGRESSION {0}: {1:.4f}s -> {2:.4f}s ({3:+.0%})'.format(name, before, after, after / before - 1))
+        if regressions:
+            return 1
+        print('No regressions against {0}'.format(args.compare))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,14 +4,331 @@ Email: nicholas.anthony.miller@gmail.com
 Description: Chinese words and roots toolkit
 """
 
-import nltk
-import gensim
-from gensim.models import Word2Vec
-from nltk.corpus import sinica_treebank as sinica
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+import functools, importlib, itertools, threading, time, warnings
 
 #The following are for CC-CEDICT:
-import csv, re
+import csv, gzip, heapq, io, math, re, zipfile
+
+#The following are for parallel similarity ranking and the model cache:
+import shutil, tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+#The following are for CC-CEDICT snapshots and saved productivity sketches:
+import base64, hashlib, json, mmap, os, struct, sys, zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence
+
+class CompoundIndex(Mapping):
+    """
+    Compact {char:[compounds]} index, e.g. {'好':['你好', '好奇', ...]}, shared by SinicaPOS, SinicaVec and CDict.
+
+    Every word is interned to an integer id (its position in self.words), and both directions
+    are stored in CSR form, as int32 arrays plus an offsets array:
+    word ids containing root r are postings[offsets[r]:offsets[r+1]], in increasing order
+    root ids of word n (one per distinct char) are word_roots[word_root_offsets[n]:word_root_offsets[n+1]]
+
+    Words added by extend() wait in per-root tail lists until one of the arrays is read (see merge()),
+    so adding a few words at a time doesn't copy the whole index each time.
+
+    compound_dict[char] builds the list of compounds from the arrays when it is accessed.
+    Like a defaultdict(list), a char with no compounds gives [].
+    """
+
+    def __init__(self, words):
+        """
+        Build the index in time linear in the total length of the words.
+
+        iterable words: unique words; ids are assigned in this order
+        """
+        #list of words; word id n is self.words[n]
+        self.words = []
+        #dictionary of format {word:word id}
+        self.word_ids = {}
+        #list of roots (chars); root id n is self.roots[n]
+        self.roots = []
+        #dictionary of format {char:root id}
+        self.root_ids = {}
+
+        #CSR arrays, read through the properties below
+        self.csr_word_root_offsets = array('i', [0])
+        self.csr_word_roots = array('i')
+        self.csr_offsets = array('i', [0])
+        self.csr_postings = array('i')
+
+        #words added since the last merge: list of root id lists, one per word,
+        #and dictionary of format {root id:[word ids]}, each list in increasing order
+        self.tail_word_roots = []
+        self.tail_postings = {}
+
+        self.extend(words)
+        self.merge()
+
+    def extend(self, words):
+        """
+        Add words to the index; words already in it are skipped.
+
+        New words get the next ids and go into the tail lists, so the cost is linear in the length
+        of the new words, not in the size of the index.
+
+        Return type: list of ids of the roots that gained words, in increasing order
+        """
+        changed = set()
+        for word in words:
+            if word in self.word_ids:
+                continue
+            word_id = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+            root_ids = []
+            for char in dict.fromkeys(word):
+                root_id = self.root_ids.get(char)
+                if root_id is None:
+                    root_id = self.root_ids[char] = len(self.roots)
+                    self.roots.append(char)
+                root_ids.append(root_id)
+                self.tail_postings.setdefault(root_id, []).append(word_id)
+                changed.add(root_id)
+            self.tail_word_roots.append(root_ids)
+        return sorted(changed)
+
+    def merge(self):
+        """
+        Merge the tail lists into the CSR arrays.
+
+        New words have the largest ids, so every root's postings stay sorted: the tail goes at the end
+        of each run. Existing runs are copied as whole slices, so the cost is linear in the number
+        of roots and postings rather than in the total length of all the words.
+
+        The arrays are replaced rather than resized, so NumPy views of the old arrays stay valid.
+        """
+        if not self.tail_word_roots:
+            return
+        word_root_offsets = array('i', self.csr_word_root_offsets)
+        word_roots = array('i', self.csr_word_roots)
+        for root_ids in self.tail_word_roots:
+            word_roots.extend(root_ids)
+            word_root_offsets.append(len(word_roots))
+
+        old_offsets = self.csr_offsets
+        old_postings = self.csr_postings
+        n_old_roots = len(old_offsets) - 1
+        offsets = array('i', [0])
+        for root_id in range(len(self.roots)):
+            old_count = old_offsets[root_id + 1] - old_offsets[root_id] if root_id < n_old_roots else 0
+            offsets.append(offsets[-1] + old_count + len(self.tail_postings.get(root_id, ())))
+        postings = array('i', bytes(old_postings.itemsize * offsets[-1]))
+        for root_id in range(n_old_roots):
+            start = offsets[root_id]
+            postings[start:start + old_offsets[root_id + 1] - old_offsets[root_id]] = old_postings[old_offsets[root_id]:old_offsets[root_id + 1]]
+        for root_id, word_ids in self.tail_postings.items():
+            postings[offsets[root_id + 1] - len(word_ids):offsets[root_id + 1]] = array('i', word_ids)
+
+        self.csr_word_root_offsets = word_root_offsets
+        self.csr_word_roots = word_roots
+        self.csr_offsets = offsets
+        self.csr_postings = postings
+        self.tail_word_roots = []
+        self.tail_postings = {}
+
+    @property
+    def word_root_offsets(self):
+        self.merge()
+        return self.csr_word_root_offsets
+
+    @property
+    def word_roots(self):
+        self.merge()
+        return self.csr_word_roots
+
+    @property
+    def offsets(self):
+        self.merge()
+        return self.csr_offsets
+
+    @property
+    def postings(self):
+        self.merge()
+        return self.csr_postings
+
+    def __len__(self):
+        return len(self.roots)
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def __contains__(self, char):
+        return char in self.root_ids
+
+    def __getitem__(self, char):
+        return [self.words[word_id] for word_id in self.get_ids(char)]
+
+    def get(self, char, default=None):
+        return self[char] if char in self.root_ids else default
+
+    def get_ids(self, char):
+        """
+        Returns array of the ids of the words containing char, in increasing order
+        """
+        root_id = self.root_ids.get(char)
+        if root_id is None:
+            return array('i')
+        ids = self.csr_postings[self.csr_offsets[root_id]:self.csr_offsets[root_id + 1]] if root_id < len(self.csr_offsets) - 1 else array('i')
+        tail = self.tail_postings.get(root_id)
+        if tail:
+            ids.extend(tail)
+        return ids
+
+    def get_count(self, char):
+        """
+        Returns the number of words containing char
+        """
+        root_id = self.root_ids.get(char)
+        if root_id is None:
+            return 0
+        return self.get_root_count(root_id)
+
+    def get_root_count(self, root_id):
+        """
+        Returns the number of words containing the root with id root_id
+        """
+        count = len(self.tail_postings.get(root_id, ()))
+        if root_id < len(self.csr_offsets) - 1:
+            count += self.csr_offsets[root_id + 1] - self.csr_offsets[root_id]
+        return count
+
+    def get_productivity_list(self):
+        """
+        Returns list of tuples with format [(char, # compounds with that character)], most compounds first
+        """
+        counts = [(root, self.get_root_count(root_id)) for root_id, root in enumerate(self.roots)]
+        return sorted(counts, key=lambda x:x[1], reverse=True)
+
+#Marks a cache miss, since None can be a cached result
+MISSING = object()
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of query results, bounded by number of entries and optionally by age.
+
+    Results are stored together with a token describing the data they were computed from
+    (a tuple of objects, e.g. the model); when the cache is used with a token holding different
+    objects, the whole cache is dropped, so results never outlive the model or dictionary they came from.
+    """
+
+    def __init__(self, capacity=1024, ttl=None):
+        """
+        int capacity: maximum number of results kept; 0 disables caching
+        float ttl: seconds a result stays valid, or None for no limit
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        #dictionary of format {key:(time stored, result)}, least recently used first
+        self.results = OrderedDict()
+        self.token = None
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key, token, default=None):
+        """
+        Returns the cached result for key, or default if there is none (counted as a miss)
+
+        hashable key: the query, e.g. ('similarity_list', '建造')
+        tuple token: the objects the result depends on, e.g. (model, compound index); compared by identity
+        """
+        now = time.monotonic()
+        with self.lock:
+            if not self.is_current(token):
+                self.invalidations += len(self.results)
+                self.results.clear()
+                self.token = token
+            cached = self.results.get(key)
+            if cached is not None:
+                if self.ttl is None or now - cached[0] < self.ttl:
+                    self.results.move_to_end(key)
+                    self.hits += 1
+                    return cached[1]
+                del self.results[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def is_current(self, token):
+        """
+        Returns True if token holds the same objects as the token of the cached results
+        """
+        return self.token is not None and len(token) == len(self.token) and \
+            all(new is old for new, old in zip(token, self.token))
+
+    def put(self, key, token, result):
+        """
+        Cache result for key, evicting the least recently used results beyond capacity
+        """
+        with self.lock:
+            if self.token is None:
+                self.token = token
+            #a result computed from data that has since changed is dropped
+            if self.capacity <= 0 or not self.is_current(token):
+                return
+            self.results[key] = (time.monotonic(), result)
+            self.results.move_to_end(key)
+            while len(self.results) > self.capacity:
+                self.results.popitem(last=False)
+                self.evictions += 1
+
+    def retoken(self, old_token, new_token):
+        """
+        Keep the cached results computed from old_token as results of new_token, for when the data
+        was replaced by an equal copy (e.g. a private copy of a read-only model)
+
+        Return type: bool, False if the cached results were not from old_token and nothing changed
+        """
+        with self.lock:
+            if not self.is_current(old_token):
+                return False
+            self.token = new_token
+            return True
+
+    def get_or_compute(self, key, token, compute):
+        """
+        Returns the cached result for key, or compute() (which is then cached)
+
+        function compute: called without arguments, outside the lock, on a miss.
+        Two threads missing on the same key at once both compute it; the results are the same.
+        """
+        result = self.get(key, token, MISSING)
+        if result is MISSING:
+            result = compute()
+            self.put(key, token, result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+    def discard_if(self, predicate):
+        """
+        Drop the cached results whose key matches predicate, e.g. the queries a model update affects
+
+        Return type: int, number of results dropped
+        """
+        with self.lock:
+            keys = [key for key in self.results if predicate(key)]
+            for key in keys:
+                del self.results[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def get_stats(self):
+        """
+        Return type: dict of format {'hits':n, 'misses':n, 'evictions':n, 'expirations':n, 'invalidations':n, 'size':n, 'capacity':n}
+
+        invalidations counts results dropped because the data they came from changed.
+        """
+        with self.lock:
+            return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions,
+                'expirations':self.expirations, 'invalidations':self.invalidations,
+                'size':len(self.results), 'capacity':self.capacity}
 
 class SinicaPOS:
     """
@@ -26,7 +343,7 @@ class SinicaPOS:
     Tools:
     """
 
-    def __init__(self, corpus_reader):
+    def __init__(self, corpus_reader=None):
         """
         Initialize object.
 
@@ -34,22 +351,133 @@ class SinicaPOS:
         Tested on NLTK's Sinica Treebank corpus, which is a SyntaxCorpusReader Object.
         Assumed to have words(), tagged_words(), sents(), tagged_sents() methods. 
         May require adjustments for other corpora.
+        If None, start empty and add sentences with add_tagged_sents() or use from_files().
         """
         
         #POS-tagged words
-        self.tagged_words = corpus_reader.tagged_words()
+        self.tagged_words = corpus_reader.tagged_words() if corpus_reader is not None else []
 
         #untagged words
-        self.words = corpus_reader.words()
+        self.words = corpus_reader.words() if corpus_reader is not None else []
 
-        #list of unique Chinese characters (hanzi)
-        self.hanzi = self.get_hanzi()
+        #the indexes and summaries are built when first used, see lazy_attributes and summary_attributes
 
+    #attributes built together by build_indexes() the first time one of them is used,
+    #and updated in place by add_tagged_sents()
+    lazy_attributes = ('compound_dict', 'wordtag_dict', 'tagword_dict', 'seen_pairs')
+
+    #attributes that depend on every word type, so are rebuilt by build_summaries() when next used after a change
+    summary_attributes = ('hanzi', 'productivity_list')
+
+    def __getattr__(self, name):
+        """
+        Build the indexes the first time one of them is accessed, then keep them as normal attributes
+        """
+        if name in SinicaPOS.lazy_attributes:
+            self.build_indexes()
+            return self.__dict__[name]
+        if name in SinicaPOS.summary_attributes:
+            self.build_summaries()
+            return self.__dict__[name]
+        raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, name))
+
+    def build_indexes(self):
+        """
+        Fill the word/tag, tag/word and compound indexes in one pass over the tagged words.
+
+        Linear in the number of tokens: each (word, tag) pair and each word type is only handled once.
+        """
+        #dictionary of format {'word':[tag1, tag2]}
+        self.wordtag_dict = defaultdict(list)
+        #dictionary of format {'tag':[word1, word2]}
+        self.tagword_dict = defaultdict(list)
+        #set of (word, tag) pairs already indexed
+        self.seen_pairs = set()
         #dictionary of format {char:[compounds]}, e.g. {'好':['你好', '好奇', ...]}
-        self.compound_dict = self.get_compound_dict()
+        self.compound_dict = CompoundIndex([])
+        self.add_pairs(self.tagged_words)
 
+    def build_summaries(self):
+        """
+        Fill self.hanzi and self.productivity_list from the current word types
+        """
+        #characters in order of first appearance in the sorted word types
+        hanzi = {}
+        for wordtype in sorted(self.compound_dict.words):
+            for char in wordtype:
+                hanzi[char] = True
+        #list of unique Chinese characters (hanzi)
+        self.hanzi = list(hanzi)
         #list of tuples of format [(char, # of compounds with that character)]
-        self.productivity_list = self.get_productivity_list()
+        self.productivity_list = self.compound_dict.get_productivity_list()
+
+    def add_pairs(self, pairs):
+        """
+        Add (word, tag) pairs to the indexes in place; pairs already indexed are skipped.
+
+        iterable pairs: (word, tag) tuples; consumed once, so a generator over a large corpus is fine
+        """
+        wordtag_dict = self.wordtag_dict
+        tagword_dict = self.tagword_dict
+        seen_pairs = self.seen_pairs
+        word_ids = self.compound_dict.word_ids
+        new_words = []
+
+        for pair in pairs:
+            if pair in seen_pairs:
+                continue
+            seen_pairs.add(pair)
+            word, tag = pair
+
+            #word types in order of first appearance (extend() skips repeats). The compound index decides
+            #what is new, not wordtag_dict, where looking a word up adds it without indexing it
+            if word not in word_ids:
+                new_words.append(word)
+            #a word might have multiple tags, and each tag will certainly have more than one word
+            wordtag_dict[word].append(tag)
+            tagword_dict[tag].append(word)
+
+        if new_words:
+            self.compound_dict.extend(new_words)
+            #rebuilt from the new word types the next time they are used
+            for name in SinicaPOS.summary_attributes:
+                self.__dict__.pop(name, None)
+
+    def add_tagged_sents(self, tagged_sents):
+        """
+        Add sentences to the indexes in place, without storing them.
+
+        iterable tagged_sents: sentences as lists of (word, tag) tuples, e.g. a generator over a
+        corpus too large for memory. Memory use grows with the number of distinct (word, tag) pairs,
+        not with the number of sentences. self.words and self.tagged_words are not changed.
+        """
+        self.add_pairs(pair for sent in tagged_sents for pair in sent)
+
+    @classmethod
+    def from_files(cls, paths, workers=1, sep='/', encoding='utf-8'):
+        """
+        Build a SinicaPOS from tagged text files, one shard per file.
+
+        list paths: files with one sentence per line, as space-separated word/TAG tokens (see read_tagged_sents)
+        int workers: number of processes to index the files in. Each worker returns only the distinct
+        (word, tag) pairs of its file, which are merged in file order, so the result is the same as
+        adding the files one after another.
+        String sep: separator between a word and its tag
+        String encoding: encoding of the files
+
+        Return type: SinicaPOS
+        """
+        pos = cls()
+        index_file = functools.partial(get_tagged_pairs, sep=sep, encoding=encoding)
+        if workers <= 1:
+            for pairs in map(index_file, paths):
+                pos.add_pairs(pairs)
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                #results come back in file order, so the indexes don't depend on scheduling
+                for pairs in pool.map(index_file, paths):
+                    pos.add_pairs(pairs)
+        return pos
 
     def get_hanzi(self):
         """
@@ -57,78 +485,409 @@ class SinicaPOS:
 
         Returns a list of Chinese characters. 
         """
-
-        #list of unique words in corpus
-        wordtypes = sorted(set(self.words))
-        hanzi = []
-
-        #iterate through the words and add to list of characters
-        for wordtype in wordtypes:
-            for char in wordtype:
-                if char not in hanzi:
-                    hanzi.append(char)
-        return hanzi
+        return self.hanzi
 
     def get_wordtag_dict(self):
         """
         Create dictionary of format {'word':[tag1, tag2]}
-        """
-        wordtag_dict = defaultdict(list)
 
-        #iterate through tagged words
-        for word, tag in set(self.tagged_words):
-            #a word might have multiple tags
-            if tag not in wordtag_dict[word]:
-                wordtag_dict[word].append(tag)
-        return wordtag_dict
+        Returns a copy, so changing it doesn't affect the indexes.
+        """
+        return {word:list(tags) for word, tags in self.wordtag_dict.items()}
 
     def get_tagword_dict(self):
         """
         Create dictionary of format {'tag':[word1, word2]}
-        """
 
-        tagword_dict = defaultdict(list)
-
-        #iterate through tagged words
-        for word, tag in set(self.tagged_words):
-            #each tag will certainly have more than one word
-            if word not in tagword_dict[tag]:
-                tagword_dict[tag].append(word)
-        return tagword_dict
+        Returns a copy, so changing it doesn't affect the indexes.
+        """
+        return {tag:list(words) for tag, words in self.tagword_dict.items()}
 
     def get_words_by_tag(self, tag_query):
         """
-        Return a list of words with a particular tag
+        Return a list of words with a particular tag (a copy)
 
         String tag_query: the tag to look for, depending on the corpus's tag conventions
         """
-        words_by_tag = [word for word, tag in set(self.tagged_words) if tag == tag_query]
-        return words_by_tag
+        return list(self.tagword_dict.get(tag_query, []))
 
     def get_compound_dict(self):
         """
         Create dictionary of format {char:[compounds]}, e.g. {'好':['你好', '好奇', ...]}
         """
-        compound_dict = defaultdict(list)
-
-        #iterate through untagged words
-        for word in set(self.words):
-            for char in word:
-                if word not in compound_dict[char]:
-                    compound_dict[char].append(word)
-        return compound_dict
+        return self.compound_dict
 
     def get_productivity_list(self):
         """
         Create list of tuples with format [(char, # compounds with that character)]
+
+        For corpora too large to index, ProductivitySketch estimates the same list in bounded memory.
+        """
+        return self.productivity_list
+
+def read_tagged_sents(path, sep='/', encoding='utf-8'):
+    """
+    Yields the sentences of a tagged text file as lists of (word, tag) tuples
+
+    One sentence per line, tokens separated by whitespace, each token word + sep + tag,
+    e.g. '我/Nh 喜歡/VK 你/Nh'. A token without sep gets the tag None.
+    """
+    with open(path, encoding=encoding) as f:
+        for line in f:
+            sent = []
+            for token in line.split():
+                word, found, tag = token.rpartition(sep)
+                sent.append((word, tag) if found else (token, None))
+            if sent:
+                yield sent
+
+def get_tagged_pairs(path, sep='/', encoding='utf-8'):
+    """
+    Returns the distinct (word, tag) pairs of a tagged text file, in order of first appearance
+
+    Run in worker processes by SinicaPOS.from_files(); the result is the size of the file's
+    vocabulary, not of the file.
+    """
+    return list(dict.fromkeys(pair for sent in read_tagged_sents(path, sep, encoding) for pair in sent))
+
+class HyperLogLog:
+    """
+    HyperLogLog estimate of the number of distinct items added, in at most 2**precision bytes.
+
+    Items are added as 64-bit hashes. Registers are kept in a dict while few are set, and
+    switched to a bytearray once that is smaller, so the many rare characters in a
+    ProductivitySketch stay small. The sum used by the estimate is updated as registers
+    change, so estimate() takes constant time.
+    """
+    __slots__ = ('precision', 'registers', 'inverse_sum', 'zeros')
+
+    def __init__(self, precision=10):
+        """
+        int precision: log2 of the number of registers, 4 to 16; the relative standard error is 1.04 / sqrt(2**precision)
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16, not {0}".format(precision))
+        self.precision = precision
+        #dictionary of format {register:rank} while sparse, then a bytearray of every register
+        self.registers = {}
+        #sum of 2**-rank over all registers, and number of registers still 0
+        self.inverse_sum = float(1 << precision)
+        self.zeros = 1 << precision
+
+    def add_hash(self, value):
+        """
+        Add an item by its 64-bit hash
+        """
+        bits = 64 - self.precision
+        rest = value & ((1 << bits) - 1)
+        self.set_register(value >> bits, bits - rest.bit_length() + 1)
+
+    def set_register(self, index, rank):
+        registers = self.registers
+        old = registers.get(index, 0) if type(registers) is dict else registers[index]
+        if rank <= old:
+            return
+        registers[index] = rank
+        self.inverse_sum += 2.0 ** -rank - 2.0 ** -old
+        if old == 0:
+            self.zeros -= 1
+            #a dict entry costs far more than a byte, so switch once an eighth of the registers are set
+            if type(registers) is dict and len(registers) > (1 << self.precision) // 8:
+                self.registers = self.get_registers()
+
+    def get_registers(self):
+        """
+        Returns every register as a bytearray
+        """
+        if type(self.registers) is not dict:
+            return bytearray(self.registers)
+        registers = bytearray(1 << self.precision)
+        for index, rank in self.registers.items():
+            registers[index] = rank
+        return registers
+
+    def items(self):
+        """
+        Yields (register, rank) for every register that is set
+        """
+        if type(self.registers) is dict:
+            yield from self.registers.items()
+        else:
+            for index, rank in enumerate(self.registers):
+                if rank:
+                    yield index, rank
+
+    def merge(self, other):
+        """
+        Add everything counted by other, a HyperLogLog with the same precision, to this one
+        """
+        for index, rank in other.items():
+            self.set_register(index, rank)
+
+    def estimate(self):
+        """
+        Returns the estimated number of distinct items added
+        """
+        m = 1 << self.precision
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / self.inverse_sum
+        #linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and self.zeros:
+            estimate = m * math.log(m / self.zeros)
+        return estimate
+
+    def get_error(self):
         """
-        productivity_list = []
-        #iterate over dictionary created by get_compound_dict()
-        for key in self.compound_dict.keys():
-            productivity_list.append((key,len(self.compound_dict[key])))
+        Returns the relative standard error of estimate()
+        """
+        return 1.04 / math.sqrt(1 << self.precision)
+
+class ProductivitySketch:
+    """
+    Streaming, approximate version of SinicaPOS.get_productivity_list() for corpora too big for memory.
+
+    For each character it keeps a HyperLogLog of the distinct words containing it (productivity by
+    type) and an exact count of the tokens of those words (productivity by token). Memory depends on
+    the number of distinct characters and the precision, not on the size of the input. Sketches built
+    on different shards or machines with the same precision can be merged, or saved and loaded.
+    """
+
+    def __init__(self, precision=10):
+        """
+        int precision: HyperLogLog precision (see HyperLogLog); 10 gives about 3% standard error
+        in at most 1 KB per character
+        """
+        self.precision = precision
+        #dictionary of format {char:HyperLogLog of words containing char}
+        self.type_sketches = {}
+        #dictionary of format {char:# tokens of words containing char}
+        self.token_counts = defaultdict(int)
+        #number of word tokens added
+        self.token_count = 0
+        #recent word hashes; cleared when full, so memory stays bounded
+        self.word_hashes = {}
+
+    #largest number of word hashes remembered between clears
+    hash_cache_size = 100000
+
+    @staticmethod
+    def hash_word(word):
+        """
+        Returns a 64-bit hash of word that is the same in every process, so sketches can be merged
+        """
+        return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def add_words(self, words):
+        """
+        Add word tokens to the sketch
+
+        iterable words: word tokens, e.g. a generator over a corpus; consumed once
+        """
+        word_hashes = self.word_hashes
+        type_sketches = self.type_sketches
+        token_counts = self.token_counts
+        n = 0
+        for word in words:
+            n += 1
+            value = word_hashes.get(word)
+            if value is None:
+                if len(word_hashes) >= self.hash_cache_size:
+                    word_hashes.clear()
+                value = word_hashes[word] = self.hash_word(word)
+            for char in dict.fromkeys(word):
+                token_counts[char] += 1
+                sketch = type_sketches.get(char)
+                if sketch is None:
+                    sketch = type_sketches[char] = HyperLogLog(self.precision)
+                sketch.add_hash(value)
+        self.token_count += n
+
+    def add_sents(self, sents):
+        """
+        Add sentences, as lists of words
+        """
+        self.add_words(word for sent in sents for word in sent)
+
+    def add_tagged_sents(self, tagged_sents):
+        """
+        Add sentences, as lists of (word, tag) tuples; the tags are ignored
+        """
+        self.add_words(word for sent in tagged_sents for word, tag in sent)
+
+    def merge(self, other):
+        """
+        Add the counts of other, a ProductivitySketch with the same precision, to this sketch
+
+        The result is the same as adding both inputs to one sketch.
+        """
+        if other.precision != self.precision:
+            raise ValueError("Can't merge sketches with precision {0} and {1}".format(self.precision, other.precision))
+        for char, sketch in other.type_sketches.items():
+            if char not in self.type_sketches:
+                self.type_sketches[char] = HyperLogLog(self.precision)
+            self.type_sketches[char].merge(sketch)
+        for char, count in other.token_counts.items():
+            self.token_counts[char] += count
+        self.token_count += other.token_count
+
+    def get_estimate(self, char, by='types'):
+        """
+        Returns (estimate, error) for one character; error is a 95% bound (two standard errors)
+
+        String by: 'types' for the number of distinct words containing char, or 'tokens' for the
+        number of tokens of those words (counted exactly, so the error is 0)
+        """
+        if by == 'tokens':
+            return self.token_counts.get(char, 0), 0
+        if by != 'types':
+            raise ValueError("by must be 'types' or 'tokens', not {0}".format(by))
+        sketch = self.type_sketches.get(char)
+        if sketch is None:
+            return 0, 0
+        estimate = sketch.estimate()
+        return estimate, 2 * sketch.get_error() * estimate
+
+    def get_top(self, k=None, by='types'):
+        """
+        Returns list of format [(char, estimate, error)] of the k most productive characters, most productive first
+
+        int k: number of characters, or None for all of them (then a full sort instead of a heap)
+        String by: 'types' or 'tokens', see get_estimate()
+        """
+        if by not in ('types', 'tokens'):
+            raise ValueError("by must be 'types' or 'tokens', not {0}".format(by))
+        estimates = ((self.get_estimate(char, by), char) for char in self.token_counts)
+        if k is None:
+            ranked = sorted(estimates, key=lambda x:x[0][0], reverse=True)
+        else:
+            ranked = heapq.nlargest(k, estimates, key=lambda x:x[0][0])
+        return [(char, estimate, error) for (estimate, error), char in ranked]
+
+    def get_productivity_list(self, k=None, by='types'):
+        """
+        Returns list of tuples with format [(char, estimated # compounds with that character)], like SinicaPOS
+        """
+        return [(char, round(estimate)) for char, estimate, error in self.get_top(k, by)]
+
+    def save(self, path):
+        """
+        Save the sketch as JSON, e.g. to merge it with sketches from other machines
+
+        String path: path of destination file
+        """
+        state = {'precision':self.precision, 'token_count':self.token_count,
+            'token_counts':self.token_counts,
+            #registers of rare characters are mostly 0, so they compress well
+            'registers':{char:base64.b64encode(zlib.compress(bytes(sketch.get_registers()))).decode('ascii') \
+                for char, sketch in self.type_sketches.items()}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a sketch written by save()
+
+        Return type: ProductivitySketch
+        """
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        sketch = cls(state['precision'])
+        sketch.token_count = state['token_count']
+        sketch.token_counts.update(state['token_counts'])
+        for char, registers in state['registers'].items():
+            type_sketch = sketch.type_sketches[char] = HyperLogLog(sketch.precision)
+            for index, rank in enumerate(zlib.decompress(base64.b64decode(registers))):
+                if rank:
+                    type_sketch.set_register(index, rank)
+        return sketch
+
+#Heavy dependencies, only imported when SinicaVec (or one of these names) is first used,
+#so that CDict and SinicaPOS users don't pay for them; of format {name:(module, attribute or None)}
+LAZY_IMPORTS = {
+    'nltk':('nltk', None),
+    'gensim':('gensim', None),
+    'np':('numpy', None),
+    'Word2Vec':('gensim.models', 'Word2Vec'),
+    'sinica':('nltk.corpus', 'sinica_treebank'),
+}
+
+def __getattr__(name):
+    """
+    Import the names in LAZY_IMPORTS on first access, e.g. chinese_roots.Word2Vec
+    """
+    if name not in LAZY_IMPORTS:
+        raise AttributeError("module '{0}' has no attribute '{1}'".format(__name__, name))
+    module_name, attribute = LAZY_IMPORTS[name]
+    value = importlib.import_module(module_name)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+#Arrays shared with a worker process by init_score_worker()
+worker_arrays = None
+
+def score_words(arrays, start, stop):
+    """
+    Sum each word's similarity to the words sharing its roots, for word ids start to stop.
+
+    dict arrays: arrays from SinicaVec.get_similarity_index(), plus 'root_sums',
+    the sum of the normed vectors of each root's words
+
+    Return type: (array of total similarity, array of # words sharing roots) for the word ids
+    """
+    import numpy as np
+    vectors = arrays['vectors']
+    root_sums = arrays['root_sums']
+    root_offsets = arrays['root_offsets']
+    root_words = arrays['root_words']
+    word_root_offsets = arrays['word_root_offsets']
+    word_roots = arrays['word_roots']
+
+    #(word id, root id) pairs for every distinct char of every word in the range
+    pair_roots = np.asarray(word_roots[word_root_offsets[start]:word_root_offsets[stop]])
+    pair_words = np.repeat(np.arange(start, stop), np.diff(word_root_offsets[start:stop + 1]))
+
+    totals = np.zeros(stop - start)
+    chunk = 1 << 16
+    for i in range(0, len(pair_words), chunk):
+        words = pair_words[i:i + chunk]
+        roots = pair_roots[i:i + chunk]
+        totals += np.bincount(words - start, weights=np.einsum('ij,ij->i', vectors[words], root_sums[roots]), \
+            minlength=stop - start)
+    counts = np.bincount(pair_words - start, weights=np.diff(root_offsets)[pair_roots], minlength=stop - start)
+
+    #words with several roots count neighbours sharing more than one of them several times
+    for word_id in range(start, stop):
+        roots = word_roots[word_root_offsets[word_id]:word_root_offsets[word_id + 1]]
+        if len(roots) < 2:
+            continue
+        neighbours = np.concatenate([root_words[root_offsets[root]:root_offsets[root + 1]] for root in roots])
+        neighbours, copies = np.unique(neighbours, return_counts=True)
+        repeated = copies > 1
+        if repeated.any():
+            totals[word_id - start] -= (copies[repeated] - 1) @ (vectors[neighbours[repeated]] @ vectors[word_id])
+        counts[word_id - start] = len(neighbours)
+    return totals, counts
+
+def init_score_worker(array_dir):
+    """
+    Process pool initializer: memory-map the arrays saved by SinicaVec.get_avg_similarities()
 
-        #return list sorted from most to least number of compounds
-        return sorted(productivity_list, key=lambda x:x[1], reverse=True)
+    String array_dir: directory holding one .npy file per array
+    """
+    import numpy as np
+    global worker_arrays
+    worker_arrays = {}
+    for filename in os.listdir(array_dir):
+        name = filename[:-len('.npy')]
+        worker_arrays[name] = np.load(os.path.join(array_dir, filename), mmap_mode='r')
+
+def score_words_in_worker(span):
+    """
+    Run score_words() in a worker process over the (start, stop) word id span
+    """
+    return score_words(worker_arrays, span[0], span[1])
 
 class SinicaVec:
     """
@@ -139,28 +898,242 @@ class SinicaVec:
     Tools:
     """
 
-    def __init__(self, corpus_reader):
+    def __init__(self, corpus_reader, cache_dir=None, rebuild=False, result_cache_size=1024, result_cache_ttl=None,
+        **params):
         """
         Required for init: sentence-tokenized Chinese corpus data
+
+        String cache_dir: optional directory for trained models. Models are stored under a hash of
+        the corpus contents and the training parameters, and loaded memory-mapped, read-only,
+        on later runs instead of being retrained.
+        bool rebuild: retrain and overwrite the cached model even if there is one
+        int result_cache_size: number of similarity results kept in memory (see ResultCache); 0 disables it
+        float result_cache_ttl: seconds a cached similarity result stays valid, or None
+        params: Word2Vec training parameters, e.g. min_count, vector_size, workers, seed
         """
         self.sents = corpus_reader.sents()
 
+        #recent get_compound_similarity_list() and get_avg_compound_similarity() results
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl)
+
         #min_count is low because of very small sample corpus size
-        self.model = Word2Vec(self.sents, min_count=1)
+        self.params = dict({'min_count':1}, **params)
+
+        #directory of the cached model for this corpus and these parameters, or None
+        self.cache_path = None if cache_dir is None else os.path.join(cache_dir, self.get_cache_key())
+
+        self.model = self.load_model(rebuild)
 
         #dictionary of format {char:[compounds]}, e.g. {'好':['你好', '好奇', ...]}
         self.compound_dict = self.get_compound_dict()
 
+    def get_cache_key(self):
+        """
+        Returns SHA-256 hex digest of the corpus sentences, the training parameters and the gensim version.
+
+        'workers' is left out: it changes training speed, not what is being trained.
+        """
+        import gensim
+        sha256 = hashlib.sha256()
+        key_params = {name:value for name, value in self.params.items() if name != 'workers'}
+        sha256.update(json.dumps([gensim.__version__, key_params], sort_keys=True, default=str).encode('utf-8'))
+        for sent in self.sents:
+            sha256.update(('\t'.join(sent) + '\n').encode('utf-8'))
+        return sha256.hexdigest()
+
+    def load_model(self, rebuild=False):
+        """
+        Returns the Word2Vec model for self.sents, from the cache if possible.
+
+        bool rebuild: retrain and overwrite the cached model even if there is one
+        """
+        from gensim.models import Word2Vec
+        if self.cache_path is None:
+            return Word2Vec(self.sents, **self.params)
+
+        model_file = os.path.join(self.cache_path, 'word2vec.model')
+        if not rebuild and os.path.exists(model_file):
+            #read-only memory map, so concurrent processes share one copy of the vectors
+            return Word2Vec.load(model_file, mmap='r')
+
+        model = Word2Vec(self.sents, **self.params)
+
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        #save to a temporary directory and rename it, so other processes never load a half-written model
+        tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(self.cache_path))
+        #sep_limit=0 stores every array in its own .npy file, so they can all be memory-mapped
+        model.save(os.path.join(tmp_path, 'word2vec.model'), sep_limit=0)
+        if os.path.exists(self.cache_path):
+            shutil.rmtree(self.cache_path)
+        try:
+            os.rename(tmp_path, self.cache_path)
+        except OSError:
+            #another process cached the same model first
+            shutil.rmtree(tmp_path)
+        return model
+
+    def update(self, sents, workers=None, epochs=None):
+        """
+        Add sentences to the vocabulary and continue training the model on them.
+
+        Only what the new sentences can change is recomputed: new words are appended to the
+        compound index, the normalized vectors of new and retrained words are refreshed, and
+        cached similarity results are dropped only for queries sharing a root with a retrained word.
+
+        iterable sents: tokenized sentences; read more than once, so use a list or a ReIterable
+        (e.g. SegmentedCorpus.sents()) for a stream, not a one-shot generator
+        int workers: training threads, e.g. os.cpu_count(); defaults to the model's setting
+        int epochs: training passes over sents; defaults to the model's setting
+
+        The updated model only lives in memory: the cached copy (see cache_dir) is not changed,
+        and rebuild_cache() retrains on the original corpus alone.
+        Not safe to call while other threads are querying this object.
+
+        Return type: list of the new vocabulary words
+        """
+        import numpy as np
+        from gensim.models import Word2Vec
+        if iter(sents) is sents:
+            raise TypeError("sents is read more than once; pass a list or a ReIterable, not an iterator")
+        if workers is not None:
+            self.params['workers'] = workers
+
+        #a memory-mapped cached model is read-only, so train a private copy
+        if self.cache_path is not None and isinstance(self.model.wv.vectors, np.memmap):
+            old_token = self.get_cache_token()
+            self.model = Word2Vec.load(os.path.join(self.cache_path, 'word2vec.model'))
+            self.normed_vectors = None
+            #the copy holds the same vectors, so results cached from the memory-mapped model still hold
+            self.result_cache.retoken(old_token, self.get_cache_token())
+        if workers is not None:
+            self.model.workers = workers
+
+        self.model.build_vocab(sents, update=True)
+        self.model.train(sents, total_examples=self.model.corpus_count,
+            epochs=self.model.epochs if epochs is None else epochs)
+
+        #words whose vectors training moved: every vocabulary word in the new sentences
+        key_to_index = self.model.wv.key_to_index
+        trained = {word for sent in sents for word in sent if word in key_to_index}
+        #new words are appended to the model's vocabulary, so they keep its order
+        new_words = [word for word in self.model.wv.index_to_key if word not in self.compound_dict.word_ids]
+        self.compound_dict.extend(new_words)
+
+        if getattr(self, 'normed_vectors', None) is not None:
+            self.update_similarity_index(trained)
+        #the averages cover the whole vocabulary; they are recomputed the next time they are needed
+        self.avg_similarities = None
+
+        #a cached result is stale if its query shares a root with a retrained word (or is one)
+        affected_roots = {char for word in trained for char in word}
+        self.result_cache.discard_if(lambda key: any(char in affected_roots for char in key[1]))
+        return new_words
+
+    def update_similarity_index(self, trained):
+        """
+        Bring the arrays built by get_similarity_index() up to date after update()
+
+        set trained: words whose vectors changed; new vocabulary words are added as well
+        """
+        import numpy as np
+        n_old = len(self.normed_vectors)
+        changed_ids = np.array(sorted({self.word_ids[word] for word in trained} | \
+            set(range(n_old, len(self.vocab_words)))), dtype=np.intp)
+        key_to_index = self.model.wv.key_to_index
+        rows = [key_to_index[self.vocab_words[word_id]] for word_id in changed_ids]
+        vectors = np.asarray(self.model.wv.vectors)[rows]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+
+        normed_vectors = np.empty((len(self.vocab_words), self.normed_vectors.shape[1]), dtype=self.normed_vectors.dtype)
+        normed_vectors[:n_old] = self.normed_vectors
+        normed_vectors[changed_ids] = vectors / norms
+        self.normed_vectors = normed_vectors
+
+        #CompoundIndex.merge() replaces the CSR arrays with ones covering the new words
+        self.root_offsets = np.frombuffer(self.compound_dict.offsets, dtype=np.intc)
+        self.root_words = np.frombuffer(self.compound_dict.postings, dtype=np.intc)
+        self.word_root_offsets = np.frombuffer(self.compound_dict.word_root_offsets, dtype=np.intc)
+        self.word_roots = np.frombuffer(self.compound_dict.word_roots, dtype=np.intc)
+
+    def rebuild_cache(self):
+        """
+        Retrain the model, overwrite its cached copy and reset everything computed from the old model
+        """
+        self.model = self.load_model(rebuild=True)
+        self.compound_dict = self.get_compound_dict()
+        self.normed_vectors = None
+        self.avg_similarities = None
+
+    @staticmethod
+    def clear_cache(cache_dir):
+        """
+        Delete every cached model in cache_dir
+
+        String cache_dir: directory passed as cache_dir to SinicaVec()
+        """
+        if not os.path.isdir(cache_dir):
+            return
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+
     def get_compound_dict(self):
         """
         Create dictionary of format {char:[compounds]}, e.g. {'好':['你好', '好奇', ...]}
         """
-        compound_dict = defaultdict(list)
-        for word in set(self.model.vocab):
-            for char in word:
-                if word not in compound_dict[char]:
-                    compound_dict[char].append(word)
-        return compound_dict
+        return CompoundIndex(self.model.wv.index_to_key)
+
+    def get_cache_token(self):
+        """
+        Returns what cached similarity results depend on; a retrained model or new vocabulary changes it
+        """
+        return (self.model, self.compound_dict)
+
+    def get_similarity_index(self):
+        """
+        Build (once) the arrays used for batch similarity scoring and keep them on the object:
+
+        self.vocab_words: vocabulary words; word id n is self.vocab_words[n]
+        self.word_ids: dictionary of format {word:word id}
+        self.normed_vectors: vectors of self.vocab_words normalized to unit length, one row per word id
+        self.root_offsets, self.root_words, self.word_root_offsets, self.word_roots:
+        the CSR arrays of self.compound_dict (see CompoundIndex), as NumPy arrays sharing its memory
+        """
+        import numpy as np
+        if getattr(self, 'normed_vectors', None) is not None:
+            return
+
+        #word ids are the ids interned by the compound index
+        self.vocab_words = self.compound_dict.words
+        self.word_ids = self.compound_dict.word_ids
+
+        #normalize the embedding matrix once; dot products of rows are then cosine similarities
+        key_to_index = self.model.wv.key_to_index
+        rows = [key_to_index[word] for word in self.vocab_words]
+        vectors = np.asarray(self.model.wv.vectors)[rows]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.normed_vectors = vectors / norms
+
+        self.root_offsets = np.frombuffer(self.compound_dict.offsets, dtype=np.intc)
+        self.root_words = np.frombuffer(self.compound_dict.postings, dtype=np.intc)
+        self.word_root_offsets = np.frombuffer(self.compound_dict.word_root_offsets, dtype=np.intc)
+        self.word_roots = np.frombuffer(self.compound_dict.word_roots, dtype=np.intc)
+
+    def get_shared_root_ids(self, query):
+        """
+        Returns sorted array of ids of the words sharing one or more roots with query
+
+        String query: word to split up into roots
+        """
+        import numpy as np
+        self.get_similarity_index()
+        shared_ids = [np.frombuffer(self.compound_dict.get_ids(char), dtype=np.intc) for char in dict.fromkeys(query)]
+        if not shared_ids:
+            return np.zeros(0, dtype=np.intc)
+        return np.unique(np.concatenate(shared_ids))
 
     def get_compound_similarity_list(self, query):
         """
@@ -174,18 +1147,63 @@ class SinicaVec:
 
         Return type: [(word1, similarity_to_query), (word2, similarity_to_query)]
         """
-        shared_roots = []
-        roots = [char for char in query if char in self.compound_dict.keys()]
-        for root in roots:
-            for compound in self.compound_dict[root]:
-                shared_roots.append(compound)
-        #create a list of all unique words that share roots
-        shared_types = list(set(shared_roots))
+        #copied, so callers can't change the cached list
+        return list(self.result_cache.get_or_compute(('similarity_list', query), self.get_cache_token(),
+            lambda: self.compute_compound_similarity_list(query)))
+
+    def compute_compound_similarity_list(self, query):
+        """
+        Returns get_compound_similarity_list(query) without using the result cache
+        """
+        import numpy as np
+        shared_ids = self.get_shared_root_ids(query)
+        #KeyError if query isn't in the model, same as model.similarity()
+        similarities = self.normed_vectors[shared_ids] @ self.normed_vectors[self.word_ids[query]]
+
+        #most similar first; stable, so ties stay in vocabulary order
+        order = np.argsort(-similarities, kind='stable')
+        return [(self.vocab_words[shared_ids[i]], similarities[i]) for i in order]
+
+    def get_compound_similarity_lists(self, queries):
+        """
+        Returns get_compound_similarity_list() for each query, computed together (equal up to float rounding)
+
+        The words sharing roots with any of the queries are gathered once and compared with
+        all the queries in one matrix product, which is much faster than one query at a time
+        when many queries arrive together.
 
-        similarity_list = []
-        for compound in shared_types:
-            similarity_list.append((compound, self.model.similarity(query, compound)))
-        return sorted(similarity_list, key=lambda x: x[1], reverse=True)
+        list queries: words in the model; KeyError if one isn't
+
+        Return type: list of [(word1, similarity_to_query), ...], one per query
+        """
+        self.get_similarity_index()
+        token = self.get_cache_token()
+        cached = {query:self.result_cache.get(('similarity_list', query), token) for query in dict.fromkeys(queries)}
+        missing = [query for query, result in cached.items() if result is None]
+        for query, result in zip(missing, self.compute_compound_similarity_lists(missing)):
+            self.result_cache.put(('similarity_list', query), token, result)
+            cached[query] = result
+        return [list(cached[query]) for query in queries]
+
+    def compute_compound_similarity_lists(self, queries):
+        """
+        Returns get_compound_similarity_lists(queries) without using the result cache
+        """
+        import numpy as np
+        query_ids = [self.word_ids[query] for query in queries]
+        if not query_ids:
+            return []
+        shared_ids = [self.get_shared_root_ids(query) for query in queries]
+        all_ids = np.unique(np.concatenate(shared_ids))
+        #one column of similarities per query, one row per word in all_ids
+        similarities = self.normed_vectors[all_ids] @ self.normed_vectors[query_ids].T
+
+        results = []
+        for column, ids in enumerate(shared_ids):
+            query_similarities = similarities[np.searchsorted(all_ids, ids), column]
+            order = np.argsort(-query_similarities, kind='stable')
+            results.append([(self.vocab_words[ids[i]], query_similarities[i]) for i in order])
+        return results
 
     def get_avg_compound_similarity(self, query):
         """
@@ -198,10 +1216,55 @@ class SinicaVec:
 
         Return type: int
         """
-        sl = self.get_compound_similarity_list(query)
-        return (sum([item[1] for item in sl]) / len(sl))
+        def compute():
+            sl = self.get_compound_similarity_list(query)
+            return (sum([item[1] for item in sl]) / len(sl))
+        return self.result_cache.get_or_compute(('avg_similarity', query), self.get_cache_token(), compute)
+
+    def get_avg_similarities(self, workers = 1):
+        """
+        Compute the average compound similarity of every word in the vocabulary at once.
+
+        For each root, the unit vectors of all words containing it are summed once. A word's total
+        similarity to its root neighbours is then the dot product of its vector with the sums for
+        each of its roots, minus the extra copies of neighbours that contain more than one of its roots.
+
+        int workers: number of processes to shard the vocabulary across. The arrays are written
+        once to memory-mapped files that every worker shares; the result is identical to workers=1.
 
-    def get_avg_similarity_dict(self, min_entries = 1):
+        Return type: (array of average similarity, array of # words sharing roots), indexed by word id
+        """
+        import numpy as np
+        if getattr(self, 'avg_similarities', None) is not None:
+            return self.avg_similarities
+
+        self.get_similarity_index()
+        #sum of the vectors of all words containing each root
+        root_sums = np.add.reduceat(self.normed_vectors[self.root_words].astype(np.float64), \
+            self.root_offsets[:-1], axis=0)
+        arrays = {'vectors':self.normed_vectors, 'root_sums':root_sums, 'root_offsets':self.root_offsets,
+            'root_words':self.root_words, 'word_root_offsets':self.word_root_offsets, 'word_roots':self.word_roots}
+
+        n_words = len(self.vocab_words)
+        if workers <= 1:
+            totals, counts = score_words(arrays, 0, n_words)
+        else:
+            #many more shards than workers, so slow shards (words with common roots) balance out
+            bounds = np.linspace(0, n_words, workers * 8 + 1).astype(int)
+            spans = [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                for name, values in arrays.items():
+                    np.save(os.path.join(tmp_dir, name + '.npy'), values)
+                with ProcessPoolExecutor(workers, initializer=init_score_worker, initargs=(tmp_dir,)) as pool:
+                    results = list(pool.map(score_words_in_worker, spans))
+            #shards come back in order, so the result doesn't depend on scheduling
+            totals = np.concatenate([result[0] for result in results])
+            counts = np.concatenate([result[1] for result in results])
+
+        self.avg_similarities = (totals / counts, counts.astype(np.int64))
+        return self.avg_similarities
+
+    def get_avg_similarity_dict(self, min_entries = 1, workers = 1):
         """
         Returns a dictionary of the form {word:avg similarity of word with other words containing its roots}
 
@@ -210,15 +1273,23 @@ class SinicaVec:
         likely have a very high average similarity (because we might only be comparing them
         to themselves)
 
+        int workers: number of processes to compute the similarities with (see get_avg_similarities)
+
         Return type: dict of format {word:avg_compound_similarity}
         """
-        avg_sim_dict = {word:self.get_avg_compound_similarity(word) for word in self.model.vocab \
-            if len(self.get_compound_similarity_list(word)) >= min_entries}
+        averages, counts = self.get_avg_similarities(workers)
+        avg_sim_dict = {word:float(averages[word_id]) for word_id, word in enumerate(self.vocab_words) \
+            if counts[word_id] >= min_entries}
         return avg_sim_dict
 
-    def get_most_similar(self, min_entries = 1):
-        avg_sim_list = [(word, self.get_avg_compound_similarity(word)) for word in self.model.vocab \
-            if len(self.get_compound_similarity_list(word)) >= min_entries]
+    def get_most_similar(self, min_entries = 1, workers = 1):
+        """
+        Returns list of format [(word, avg compound similarity)], from most to least similar
+
+        int min_entries: minimum number of entries in the compound similarity list (see get_avg_similarity_dict)
+        int workers: number of processes to compute the similarities with (see get_avg_similarities)
+        """
+        avg_sim_list = list(self.get_avg_similarity_dict(min_entries, workers).items())
         return sorted(avg_sim_list, key=lambda x: x[1], reverse=True)
 
     def get_max_compound_similarity(self):
@@ -241,83 +1312,1217 @@ class SinicaVec:
         min_similarity = [(key, avg_sim_dict[key]) for key in avg_sim_dict.keys() if avg_sim_dict[key] == min_avg_sim]
         return min_similarity
 
-class CDict:
-    """
-    Class for analyzing compound words using open-source CC-CEDICT dictionary.
+#First bytes of a CDict snapshot file; bump the version when the layout changes
+SNAPSHOT_MAGIC = b'CDSNAP02'
 
-    Required for init: CC-CEDICT dictionary in CSV format.
-    
-    NOTE: If you have a copy of the dictionary in the standard .u8 format distributed
-    from the website, you can use the from_txt method to convert it.
+def get_source_stat(path):
+    """
+    Returns (size, modification time in ns) of a file, used to spot a changed CC-CEDICT CSV
     """
-    def __init__(self, cedict_source):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
 
-        #dictionary of the format {character:[list of all dictionary entries for words including that character]}
-        self.word_dict = defaultdict(list)
+def get_source_hash(path):
+    """
+    Returns the SHA-1 hex digest of a file's contents
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
 
-        #list of all unique Chinese characters in the dictionary
-        self.hanzi = []
+def write_snapshot(path, header, sections):
+    """
+    Write a snapshot file.
 
-        #open the CSV dictionary
-        with open(cedict_source, mode='r') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                #add unique Chinese characters to self.hanzi
-                if len(row[0]) == 1 and row[0] not in self.hanzi: self.hanzi.append(row[0])
-                #populate self.word_dict in list form because a word might have more than one entry
-                self.word_dict[row[0]].append(row[0:])
+    String path: path of destination file
+    dict header: JSON-serializable metadata
+    dict sections: named sections of format {name:bytes, int32 array or memoryview}
+
+    Layout: magic, 4-byte header length, JSON header, then each section padded to 8 bytes.
+    The header records the offset (from the first section), length and type of every section.
+    """
+    header = dict(header, byteorder=sys.byteorder, sections={})
+    offset = 0
+    for name, values in sections.items():
+        #sections can also be memoryviews of a loaded snapshot, so a loaded dictionary can be saved again
+        if isinstance(values, array):
+            typecode, length = values.typecode, len(values) * values.itemsize
+        elif isinstance(values, memoryview):
+            typecode, length = values.format, values.nbytes
+        else:
+            typecode, length = 'B', len(values)
+        header['sections'][name] = [offset, length, typecode]
+        offset += length + (-length % 8)
+    encoded = json.dumps(header).encode('utf-8')
+
+    #write to a temporary file first so readers never see a half-written snapshot
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<I', len(encoded)))
+        f.write(encoded)
+        f.write(b'\0' * (-f.tell() % 8))
+        for values in sections.values():
+            data = values.tobytes() if isinstance(values, array) else bytes(values)
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+def read_snapshot(path):
+    """
+    Memory-map a snapshot file written by write_snapshot().
+
+    String path: path of snapshot file
+
+    Return type: (dict header, dict of format {name:memoryview}, mmap buffer)
+    Int32 sections are returned as memoryviews cast to 'i', other sections as byte memoryviews.
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError("{0} is not a CDict snapshot".format(path))
+    header_start = len(SNAPSHOT_MAGIC) + 4
+    header_len = struct.unpack('<I', buffer[len(SNAPSHOT_MAGIC):header_start])[0]
+    header = json.loads(buffer[header_start:header_start + header_len].decode('utf-8'))
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError("{0} was written on a {1}-endian machine".format(path, header['byteorder']))
+
+    view = memoryview(buffer)
+    data_start = header_start + header_len
+    data_start += -data_start % 8
+    sections = {}
+    for name, (offset, length, typecode) in header['sections'].items():
+        offset += data_start
+        section = view[offset:offset + length]
+        sections[name] = section if typecode == 'B' else section.cast(typecode)
+    return header, sections, buffer
+
+#One line of the CC-CEDICT .u8 file: trad simp [pinyin] /meaning1/meaning2/
+CEDICT_LINE = re.compile(r'(\S+)\s+(\S+)\s+\[([^\]]*)\]\s+/(.*)/\s*$')
+
+def open_cedict_txt(path):
+    """
+    Open a CC-CEDICT .u8 file for reading line by line, as text.
+
+    String path: path of a plain, gzip or zip file; the format is detected from the first bytes.
+    A zip archive is expected to hold the dictionary as its only (or only .u8/.txt) member.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic[:2] == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding='utf-8-sig')
+    if magic == b'PK\x03\x04':
+        archive = zipfile.ZipFile(path)
+        names = [name for name in archive.namelist() if not name.endswith('/')]
+        if len(names) > 1:
+            names = [name for name in names if name.endswith(('.u8', '.txt'))]
+        if len(names) != 1:
+            archive.close()
+            raise ValueError("Couldn't find the dictionary in {0}".format(path))
+        return io.TextIOWrapper(archive.open(names[0]), encoding='utf-8-sig')
+    return open(path, 'r', encoding='utf-8-sig')
+
+#Markers looked for in every field of a CC-CEDICT entry, of format {flag:marker}; see CDict.get_by_flag()
+FLAG_MARKERS = {
+    'idiom':'(idiom)',
+    'variant':'variant',
+    'gugja':'gugja',
+    'surname':'surname',
+    'classifier':'CL:',
+    'abbreviation':'abbr.',
+    'slang':'(slang)',
+    'dialect':'(dialect)',
+    'literary':'(literary)',
+    'archaic':'(archaic)',
+    'old':'(old)',
+    'onomatopoeia':'(onom.)',
+    'taiwan':'(Tw)',
+    'buddhism':'(Buddhism)',
+    'loanword':'(loanword)',
+}
+
+class Trie:
+    """
+    Character trie used to index CC-CEDICT headwords for wildcard search.
+
+    Keys are added to a dict-based trie, then freeze() flattens it into int32 arrays
+    so it is compact in memory and can be saved to (and memory-mapped from) a snapshot.
+    Every node holds, in insertion order, the ids of every key whose path passes through it,
+    so looking up a prefix is proportional to the length of the prefix plus the number of matching keys.
+    """
+
+    #names of the flat arrays, in the order they are stored in a snapshot
+    array_names = ('child_offsets', 'child_chars', 'child_nodes', 'id_offsets', 'ids', 'terminals')
+
+    def __init__(self, arrays=None):
+        """
+        dict arrays: flat arrays of format {name:int32 array}, e.g. loaded from a snapshot.
+        Leave out to build a new trie with add() and freeze().
+        """
+        #nodes of format [{char:child_node}, [key ids], id of key ending here or -1]
+        self.root = [{}, [], -1] if arrays is None else None
+        if arrays is not None:
+            for name in self.array_names:
+                setattr(self, name, arrays[name])
+
+    def add(self, key, key_id):
+        """
+        Add a key to the trie.
+
+        String key: the characters to add, one node per character
+        int key_id: id stored at every node along the path. Ids must be added in increasing order.
+        """
+        node = self.root
+        if not node[1] or node[1][-1] != key_id:
+            node[1].append(key_id)
+        for char in key:
+            if char not in node[0]:
+                node[0][char] = [{}, [], -1]
+            node = node[0][char]
+            #a key can pass through the same node twice (e.g. infix index), so only add it once
+            if not node[1] or node[1][-1] != key_id:
+                node[1].append(key_id)
+        node[2] = key_id
+
+    def freeze(self):
+        """
+        Flatten the trie into int32 arrays, numbering the nodes breadth-first.
+
+        child_offsets/child_chars/child_nodes: children of node n are
+        child_chars[child_offsets[n]:child_offsets[n+1]], sorted by code point
+        id_offsets/ids: key ids stored at node n are ids[id_offsets[n]:id_offsets[n+1]]
+        terminals: id of the key ending at node n, or -1
+        """
+        self.child_offsets = array('i', [0])
+        self.child_chars = array('i')
+        self.child_nodes = array('i')
+        self.id_offsets = array('i', [0])
+        self.ids = array('i')
+        self.terminals = array('i')
+
+        nodes = [self.root]
+        for node in nodes:
+            children, key_ids, terminal = node
+            for char in sorted(children):
+                self.child_chars.append(ord(char))
+                self.child_nodes.append(len(nodes))
+                nodes.append(children[char])
+            self.child_offsets.append(len(self.child_chars))
+            self.ids.extend(key_ids)
+            self.id_offsets.append(len(self.ids))
+            self.terminals.append(terminal)
+
+        #the dict-based nodes are no longer needed
+        self.root = None
+        return self
+
+    def get_node(self, prefix):
+        """
+        Returns the number of the node reached by walking prefix from the root, or -1
+        """
+        node = 0
+        for char in prefix:
+            lo = self.child_offsets[node]
+            hi = self.child_offsets[node + 1]
+            code = ord(char)
+            i = bisect_left(self.child_chars, code, lo, hi)
+            if i == hi or self.child_chars[i] != code:
+                return -1
+            node = self.child_nodes[i]
+        return node
+
+    def get(self, prefix):
+        """
+        Returns the ids of all keys added under prefix, in insertion order
+
+        String prefix: characters to walk down from the root
+        """
+        node = self.get_node(prefix)
+        if node == -1:
+            return []
+        return self.ids[self.id_offsets[node]:self.id_offsets[node + 1]].tolist()
+
+    def get_many(self, prefixes):
+        """
+        Returns dictionary of format {prefix:ids} for many prefixes; see get()
+
+        The prefixes are walked in sorted order, and each walk resumes from the longest
+        prefix it shares with the previous one instead of starting again at the root.
+        """
+        results = {}
+        previous = ''
+        #path[n] is the node reached by the first n chars of previous, or -1 past a dead end
+        path = [0]
+        for prefix in sorted(set(prefixes)):
+            shared = 0
+            limit = min(len(prefix), len(previous))
+            while shared < limit and prefix[shared] == previous[shared]:
+                shared += 1
+            del path[shared + 1:]
+            node = path[-1]
+            for char in prefix[shared:]:
+                if node != -1:
+                    lo = self.child_offsets[node]
+                    hi = self.child_offsets[node + 1]
+                    code = ord(char)
+                    i = bisect_left(self.child_chars, code, lo, hi)
+                    node = self.child_nodes[i] if i < hi and self.child_chars[i] == code else -1
+                path.append(node)
+            previous = prefix
+            results[prefix] = [] if node == -1 else self.ids[self.id_offsets[node]:self.id_offsets[node + 1]].tolist()
+        return results
+
+    def longest_match(self, text, start):
+        """
+        Returns (length, key id) of the longest key that text[start:] starts with, or (0, -1)
+        """
+        node = 0
+        best = (0, -1)
+        for end in range(start, len(text)):
+            lo = self.child_offsets[node]
+            hi = self.child_offsets[node + 1]
+            code = ord(text[end])
+            i = bisect_left(self.child_chars, code, lo, hi)
+            if i == hi or self.child_chars[i] != code:
+                break
+            node = self.child_nodes[i]
+            if self.terminals[node] != -1:
+                best = (end + 1 - start, self.terminals[node])
+        return best
+
+    def find(self, key):
+        """
+        Returns the id of the key exactly matching key, or -1
+        """
+        node = self.get_node(key)
+        if node == -1:
+            return -1
+        return self.terminals[node]
+
+    def get_arrays(self):
+        """
+        Returns the flat arrays of format {name:int32 array}
+        """
+        return {name:getattr(self, name) for name in self.array_names}
+
+class StringTable(Sequence):
+    """
+    Read-only list of strings stored as one UTF-8 blob plus an offsets array.
+
+    Used by CDict snapshots so strings are only decoded when they are accessed.
+    """
+
+    def __init__(self, blob, offsets, ids=None):
+        """
+        bytes blob: all strings encoded as UTF-8 and concatenated
+        int32 array offsets: string n is blob[offsets[n]:offsets[n+1]]
+        int32 array ids: optional; if given, the table is the strings with these ids, in this order
+        """
+        self.blob = blob
+        self.offsets = offsets
+        self.ids = ids
+
+    def __len__(self):
+        if self.ids is not None:
+            return len(self.ids)
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        if self.ids is not None:
+            n = self.ids[n]
+        return str(self.blob[self.offsets[n]:self.offsets[n + 1]], 'utf-8')
+
+    @staticmethod
+    def build(strings):
+        """
+        Encode a list of strings.
+
+        Return type: (bytes blob, int32 array offsets)
+        """
+        offsets = array('i', [0])
+        blob = bytearray()
+        for string in strings:
+            blob += string.encode('utf-8')
+            offsets.append(len(blob))
+        return bytes(blob), offsets
+
+class EntryTable(Mapping):
+    """
+    Read-only dictionary of format {word:[list of all dictionary entries for that word]}, used as CDict.word_dict.
+
+    Entries are stored as string ids in CSR arrays (in memory, or memory-mapped from a snapshot)
+    and decoded each time they are accessed.
+    """
+
+    def __init__(self, strings, keys, key_rows, row_fields, fields, trie):
+        """
+        StringTable strings: all keys and fields in the dictionary
+        StringTable keys: dictionary keys in load order
+        int32 array key_rows: rows of key n are rows key_rows[n] to key_rows[n+1]
+        int32 array row_fields: fields of row n are fields[row_fields[n]:row_fields[n+1]]
+        int32 array fields: string ids of each field
+        Trie trie: prefix trie over the keys, used to find a key's id
+        """
+        self.strings = strings
+        self.keys_table = keys
+        self.key_rows = key_rows
+        self.row_fields = row_fields
+        self.fields = fields
+        self.trie = trie
+
+    def __len__(self):
+        return len(self.keys_table)
+
+    def __iter__(self):
+        return iter(self.keys_table)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.trie.find(key) != -1
+
+    def __getitem__(self, key):
+        key_id = self.trie.find(key) if isinstance(key, str) else -1
+        if key_id == -1:
+            raise KeyError(key)
+        return self.get_entries(key_id)
+
+    def get_entries(self, key_id):
+        """
+        Returns the entries of the key with id key_id
+        """
+        return [self.get_row(row) for row in range(self.key_rows[key_id], self.key_rows[key_id + 1])]
+
+    def get_row(self, row):
+        """
+        Returns one entry, by row id (rows are numbered in key order)
+        """
+        field_ids = self.fields[self.row_fields[row]:self.row_fields[row + 1]]
+        return [self.strings[field_id] for field_id in field_ids]
+
+    def get_field(self, row, field):
+        """
+        Returns one field of an entry, e.g. field 1 is the simplified form, or '' if the entry is too short
+        """
+        position = self.row_fields[row] + field
+        if position >= self.row_fields[row + 1]:
+            return ''
+        return self.strings[self.fields[position]]
+
+    def get_row_count(self):
+        """
+        Returns the number of entries (rows)
+        """
+        return len(self.row_fields) - 1
+
+def build_search_tries(words):
+    """
+    Create the prefix, suffix and infix tries used for wildcard search over a list of words
+
+    list words: words to index; a word's id is its position in the list
+
+    Prefix trie: every word, for '而*' queries
+    Suffix trie: every word reversed, for '*而' queries
+    Infix trie: every substring that neither starts nor ends the word, for '*而*' queries
+
+    Return type: (Trie, Trie, Trie)
+    """
+    #each trie is frozen before the next is started, so only one dict-based trie is in memory at a time
+    prefix_trie = Trie()
+    for word_id, word in enumerate(words):
+        prefix_trie.add(word, word_id)
+    prefix_trie.freeze()
+
+    suffix_trie = Trie()
+    for word_id, word in enumerate(words):
+        suffix_trie.add(word[::-1], word_id)
+    suffix_trie.freeze()
+
+    infix_trie = Trie()
+    for word_id, word in enumerate(words):
+        #add each substring starting after the first char and stopping before the last char
+        for start in range(1, len(word) - 1):
+            infix_trie.add(word[start:-1], word_id)
+    infix_trie.freeze()
+    return prefix_trie, suffix_trie, infix_trie
+
+def split_query(query):
+    """
+    Returns (trie, text) for a wildcard query: which search trie answers it, and the text to walk it with
+
+    '而*' and '而' give ('prefix', '而'), '*而' gives ('suffix', '而') (reversed, as stored), '*而*' gives ('infix', '而')
+    """
+    #if first and last char in query is *, find all words with query in the middle
+    if query.startswith('*') and query.endswith('*'):
+        return 'infix', query[1:-1]
+    #if first char in query is *, find all words ending with the query
+    elif query.startswith('*'):
+        return 'suffix', query[1:][::-1]
+    #if last char in query is *, find all words starting with the query
+    elif query.endswith('*'):
+        return 'prefix', query[:-1]
+    #if no * in query, find all words starting with the query
+    else:
+        return 'prefix', query
+
+def filter_infix(infix, word_ids, words):
+    """
+    Returns the word ids from the infix trie that neither start nor end with infix
+    """
+    if not infix:
+        return []
+    #the infix trie only holds inner occurrences, so drop words that also start or end with the query
+    return [word_id for word_id in word_ids if not words[word_id].startswith(infix) and not words[word_id].endswith(infix)]
+
+def search_tries(query, words, prefix_trie, suffix_trie, infix_trie):
+    """
+    Returns the ids of the words matching a wildcard query, in id order; see CDict.search()
+
+    String query: '而*', '*而', '*而*' or '而'
+    list words: the words indexed by the tries
+    Trie prefix_trie, suffix_trie, infix_trie: tries from build_search_tries(words)
+    """
+    form, text = split_query(query)
+    if form == 'infix':
+        return filter_infix(text, infix_trie.get(text), words)
+    elif form == 'suffix':
+        return suffix_trie.get(text)
+    return prefix_trie.get(text)
+
+def search_tries_many(queries, words, prefix_trie, suffix_trie, infix_trie):
+    """
+    Returns dictionary of format {query:word ids} for many wildcard queries; see search_tries()
+
+    Repeated queries are answered once, and the queries for each trie are walked together
+    in sorted order, so a shared prefix is only walked once (see Trie.get_many()).
+    """
+    texts = {'prefix':{}, 'suffix':{}, 'infix':{}}
+    for query in set(queries):
+        form, text = split_query(query)
+        texts[form].setdefault(text, []).append(query)
+
+    results = {}
+    for form, trie in (('prefix', prefix_trie), ('suffix', suffix_trie), ('infix', infix_trie)):
+        for text, word_ids in trie.get_many(texts[form]).items():
+            if form == 'infix':
+                word_ids = filter_infix(text, word_ids, words)
+            for query in texts[form][text]:
+                results[query] = word_ids
+    return results
+
+def normalize_pinyin(pinyin, tones=True):
+    """
+    Returns pinyin in the form used by the pinyin indexes: lower case, single spaces, 'u:' as 'v'
+
+    String pinyin: CC-CEDICT style pinyin, e.g. 'Lu:3 yan2'
+    bool tones: keep the tone numbers; if False, 'lu:3 yan2' and 'lv yan' both give 'lv yan'
+    """
+    pinyin = ' '.join(pinyin.lower().replace('u:', 'v').split())
+    if not tones:
+        pinyin = pinyin.translate(PINYIN_TONES)
+    return pinyin
+
+#Tone numbers dropped by normalize_pinyin(tones=False)
+PINYIN_TONES = str.maketrans('', '', '12345')
+
+class FormIndex:
+    """
+    Index of CDict entries by another form of the headword, e.g. simplified characters or pinyin.
+
+    Each distinct form gets an id (first-seen order); the entries with that form are stored
+    as sorted row ids in CSR form. Exact lookups are one dict lookup; wildcard search tries
+    over the forms are only built the first time they are needed.
+    """
+
+    def __init__(self, row_forms):
+        """
+        iterable row_forms: the form of each dictionary row, in row id order
+        """
+        #list of distinct forms; form id n is self.forms[n]
+        self.forms = []
+        #dictionary of format {form:form id}
+        self.form_ids = {}
+        form_rows = []
+        for row_id, form in enumerate(row_forms):
+            form_id = self.form_ids.get(form)
+            if form_id is None:
+                form_id = self.form_ids[form] = len(self.forms)
+                self.forms.append(form)
+                form_rows.append(array('i'))
+            form_rows[form_id].append(row_id)
+
+        #row ids of form n are self.rows[self.offsets[n]:self.offsets[n+1]]
+        self.offsets = array('i', [0])
+        self.rows = array('i')
+        for row_ids in form_rows:
+            self.rows.extend(row_ids)
+            self.offsets.append(len(self.rows))
+        self.tries = None
+
+    def get_rows(self, form_id):
+        """
+        Returns the row ids of the entries with form id form_id
+        """
+        return self.rows[self.offsets[form_id]:self.offsets[form_id + 1]].tolist()
+
+    def lookup(self, form):
+        """
+        Returns the row ids of the entries with exactly this form
+        """
+        form_id = self.form_ids.get(form)
+        return [] if form_id is None else self.get_rows(form_id)
+
+    def get_search_tries(self):
+        """
+        Build (once) and return the prefix, suffix and infix tries over the forms
+        """
+        if self.tries is None:
+            self.tries = build_search_tries(self.forms)
+        return self.tries
+
+    def search(self, query):
+        """
+        Returns the row ids of the entries whose form matches a wildcard query, in load order; see CDict.search()
+        """
+        row_ids = []
+        for form_id in search_tries(query, self.forms, *self.get_search_tries()):
+            row_ids.extend(self.get_rows(form_id))
+        return sorted(row_ids)
+
+#Words in English definitions, for the definition index; 'CL:個|个[ge4]' gives 'cl', '個', '个', 'ge4'
+DEFINITION_TOKEN = re.compile(r'[^\W_]+')
+
+#Query syntax of DefinitionIndex.search(): quoted phrases, OR, and single words
+DEFINITION_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+def tokenize_definition(text):
+    """
+    Returns the lower-case words of one definition field as a list
+    """
+    return DEFINITION_TOKEN.findall(text.lower())
+
+class DefinitionIndex:
+    """
+    Inverted index from the words of English definitions to CDict entries, for reverse lookups.
+
+    Postings are sorted row ids in CSR arrays, with the number of times the word
+    occurs in the row's definitions alongside, and the word's positions in the row for
+    matching phrases. Matches are ranked with BM25, and a word's score is the score of its best entry.
+    """
+    #BM25 parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, word_dict, first_field=3):
+        """
+        EntryTable word_dict: the dictionary to index
+        int first_field: index of the first definition field in each row (after trad, simp and pinyin)
+        """
+        self.word_dict = word_dict
+        self.first_field = first_field
+        #dictionary of format {word:term id}
+        self.term_ids = {}
+        term_rows = []
+        term_freqs = []
+        term_positions = []
+        #number of words in each row's definitions, for length normalization and search_top()
+        self.row_lengths = array('i')
+        #key id of each row
+        self.row_keys = array('i')
+        key_rows = word_dict.key_rows
+        for key_id in range(len(key_rows) - 1):
+            for row in range(key_rows[key_id], key_rows[key_id + 1]):
+                #dictionary of format {word:[positions]}; fields are numbered with a gap
+                #between them, so a phrase can't match across two definitions
+                token_positions = {}
+                position = 0
+                for field in word_dict.get_row(row)[first_field:]:
+                    for token in tokenize_definition(field):
+                        token_positions.setdefault(token, []).append(position)
+                        position += 1
+                    position += 1
+                length = 0
+                for token, positions in token_positions.items():
+                    term_id = self.term_ids.get(token)
+                    if term_id is None:
+                        term_id = self.term_ids[token] = len(term_rows)
+                        term_rows.append(array('i'))
+                        term_freqs.append(array('i'))
+                        term_positions.append(array('i'))
+                    #rows are visited in order, so each posting list is already sorted
+                    term_rows[term_id].append(row)
+                    term_freqs[term_id].append(len(positions))
+                    term_positions[term_id].extend(positions)
+                    length += len(positions)
+                self.row_lengths.append(length)
+                self.row_keys.append(key_id)
+
+        #postings of term n are self.postings[self.offsets[n]:self.offsets[n+1]], counts in self.freqs;
+        #positions of posting i are self.positions[self.position_offsets[i]:self.position_offsets[i+1]]
+        self.offsets = array('i', [0])
+        self.postings = array('i')
+        self.freqs = array('i')
+        self.positions = array('i')
+        for rows, freqs, positions in zip(term_rows, term_freqs, term_positions):
+            self.postings.extend(rows)
+            self.freqs.extend(freqs)
+            self.positions.extend(positions)
+            self.offsets.append(len(self.postings))
+        del term_rows, term_freqs, term_positions
+        self.position_offsets = array('i', [0])
+        self.position_offsets.extend(itertools.accumulate(self.freqs))
+
+        n_rows = len(self.row_lengths)
+        avg_length = sum(self.row_lengths) / n_rows if n_rows else 1.0
+        #BM25 length normalization of each row
+        self.row_norms = array('d', [self.k1 * (1 - self.b + self.b * length / avg_length) for length in self.row_lengths])
+        #inverse document frequency of each term
+        self.idf = [math.log(1 + (n_rows - df + 0.5) / (df + 0.5)) \
+            for df in (self.offsets[n + 1] - self.offsets[n] for n in range(len(self.term_ids)))]
+        #dictionary of format {term id:(posting indices, negated impacts)}, see get_impact_order()
+        self.impact_orders = {}
+
+    def get_postings(self, token):
+        """
+        Returns (rows, counts) of a word as array slices, empty if the word is not in the index
+        """
+        term_id = self.term_ids.get(token)
+        if term_id is None:
+            return array('i'), array('i')
+        start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.postings[start:stop], self.freqs[start:stop]
+
+    @staticmethod
+    def intersect(posting_lists):
+        """
+        Returns the sorted row ids found in every posting list
+
+        The shortest list is walked and the others are searched with bisect, so the cost
+        depends on the rarest word rather than the most common one.
+        """
+        if not posting_lists:
+            return []
+        posting_lists = sorted(posting_lists, key=len)
+        rows = []
+        starts = [0] * len(posting_lists)
+        for row in posting_lists[0]:
+            for n in range(1, len(posting_lists)):
+                postings = posting_lists[n]
+                i = bisect_left(postings, row, starts[n])
+                starts[n] = i
+                if i == len(postings) or postings[i] != row:
+                    break
+            else:
+                rows.append(row)
+        return rows
+
+    def find_postings(self, row, tokens):
+        """
+        Returns dictionary of format {word:posting index} of the words in tokens that occur in row
+        """
+        found = {}
+        for token in tokens:
+            term_id = self.term_ids.get(token)
+            if term_id is not None:
+                stop = self.offsets[term_id + 1]
+                i = bisect_left(self.postings, row, self.offsets[term_id], stop)
+                if i < stop and self.postings[i] == row:
+                    found[token] = i
+        return found
+
+    def get_count(self, token):
+        """
+        Returns the number of rows with a word in their definitions
+        """
+        term_id = self.term_ids.get(token)
+        return 0 if term_id is None else self.offsets[term_id + 1] - self.offsets[term_id]
+
+    def get_positions(self, i):
+        """
+        Returns the positions of the word of posting i in that row's definitions, as an array slice
+        """
+        return self.positions[self.position_offsets[i]:self.position_offsets[i + 1]]
+
+    def has_phrase(self, row, phrase, found=None):
+        """
+        Returns True if the words of phrase occur next to each other in one definition field of row
+
+        Uses the stored positions, so the row is not decoded or tokenized again.
+        dict found: the row's postings from find_postings(), if already looked up
+        """
+        if found is None:
+            found = self.find_postings(row, phrase)
+        if any(token not in found for token in phrase):
+            return False
+        following = [set(self.get_positions(found[token])) for token in phrase[1:]]
+        return any(all(position + n in positions for n, positions in enumerate(following, 1)) \
+            for position in self.get_positions(found[phrase[0]]))
+
+    def match_row(self, row, clause, found):
+        """
+        Returns True if row has every word and phrase in clause; the one-row version of match_clause()
+
+        dict found: the row's postings from find_postings()
+        """
+        for phrase in clause:
+            if len(phrase) > 1:
+                if not self.has_phrase(row, phrase, found):
+                    return False
+            elif phrase[0] not in found:
+                return False
+        return True
+
+    def match_clause(self, clause):
+        """
+        Returns the sorted row ids matching every word and phrase in clause
+
+        list clause: list of token lists; a list with more than one token is a phrase
+        """
+        tokens = [token for phrase in clause for token in phrase]
+        rows = self.intersect([self.get_postings(token)[0] for token in set(tokens)])
+        for phrase in clause:
+            if len(phrase) > 1:
+                rows = [row for row in rows if self.has_phrase(row, phrase)]
+        return rows
+
+    @staticmethod
+    def parse(query):
+        """
+        Returns query as a list of OR'ed clauses, each a list of AND'ed token lists (words or phrases)
+
+        e.g. 'big "red wine" OR beer' gives [[['big'], ['red', 'wine']], [['beer']]]
+        """
+        clauses = [[]]
+        for phrase, word in DEFINITION_QUERY.findall(query):
+            if word == 'OR':
+                clauses.append([])
+                continue
+            tokens = tokenize_definition(phrase or word)
+            if tokens:
+                clauses[-1].append(tokens)
+        return [clause for clause in clauses if clause]
+
+    def get_impact(self, term_id, i):
+        """
+        Returns what posting i of a term adds to its row's BM25 score
+        """
+        freq = self.freqs[i]
+        return self.idf[term_id] * (self.k1 + 1) * freq / (freq + self.row_norms[self.postings[i]])
+
+    def score(self, rows, tokens):
+        """
+        Returns dictionary of format {row:BM25 score} for the query words tokens
+
+        The rows are looked up by bisecting into each word's postings in row order, as intersect()
+        does, so a common word's long posting list is not walked for a few rows. When there are
+        about as many rows as postings, walking the postings once is faster, and is done instead.
+        """
+        rows = sorted(rows)
+        scores = dict.fromkeys(rows, 0.0)
+        postings = self.postings
+        for token in tokens:
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                continue
+            i, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            if len(rows) * 4 < stop - i:
+                for row in rows:
+                    i = bisect_left(postings, row, i, stop)
+                    if i == stop:
+                        break
+                    if postings[i] == row:
+                        scores[row] += self.get_impact(term_id, i)
+            else:
+                #the same sum as get_impact(), inlined
+                idf = self.idf[term_id] * (self.k1 + 1)
+                for row, freq in zip(postings[i:stop], self.freqs[i:stop]):
+                    if row in scores:
+                        scores[row] += idf * freq / (freq + self.row_norms[row])
+        return scores
+
+    def get_impact_order(self, term_id):
+        """
+        Returns (posting indices, negated impacts) of a term, where a posting's impact is what the word
+        adds to the row's BM25 score. Highest impact first, and in row order among equal impacts;
+        the impacts are negated so they can be bisected.
+
+        Sorted the first time the term is used in a search with a limit, then kept.
+        """
+        result = self.impact_orders.get(term_id)
+        if result is None:
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            impacts = [self.get_impact(term_id, i) for i in range(start, stop)]
+            order = sorted(range(len(impacts)), key=lambda n: -impacts[n])
+            result = (array('i', [start + n for n in order]), array('d', [-impacts[n] for n in order]))
+            self.impact_orders[term_id] = result
+        return result
+
+    def search_top(self, clause, tokens, k):
+        """
+        Returns list of format [(score, -key id)] of the k best words matching clause, best first,
+        scoring only the rows that could be among them (the threshold algorithm), or None if that
+        would take longer than intersecting
+
+        Every matching row has the clause's rarest word, so that word's postings are walked by
+        impact (see get_impact_order()), checking and scoring each row. A row further down gets at
+        most the next impact plus the highest impact of each other word, so the walk stops once
+        that can't beat the k-th best word. A row is also skipped without being checked if the
+        other words couldn't raise it that high in the rest of its definitions. Checking a row is
+        several times slower than intersecting, so the walk gives up after a quarter of the rows.
+
+        list tokens: the words of clause, in the order score() adds them up
+        """
+        if k <= 0 or any(token not in self.term_ids for token in tokens):
+            return []
+        term_ids = [self.term_ids[token] for token in tokens]
+        rarest = self.term_ids[min(tokens, key=self.get_count)]
+        order, impacts = self.get_impact_order(rarest)
+        max_impacts = [-self.get_impact_order(term_id)[1][0] for term_id in term_ids]
+
+        def get_bound(position, row=None):
+            #added up in the same order as the scores, so a row's score can't round above it
+            bound = 0.0
+            if row is not None:
+                #the other words occur at most this many times in the row
+                room = self.row_lengths[row] - self.freqs[order[position]]
+            for term_id, max_impact in zip(term_ids, max_impacts):
+                if term_id == rarest:
+                    bound -= impacts[position]
+                elif row is None:
+                    bound += max_impact
+                else:
+                    bound += min(max_impact, self.idf[term_id] * (self.k1 + 1) * room / (room + self.row_norms[row]))
+            return bound
+
+        #min-heap of (score, -key id) of the best words so far
+        top = []
+        key_scores = {}
+        checked = 0
+        position = 0
+        while position < len(order):
+            row = self.postings[order[position]]
+            if len(top) == k:
+                score, negative_key_id = top[0]
+                bound = get_bound(position)
+                if bound < score:
+                    break
+                #a tie goes to the earlier word, and the rest of a run of equal impacts is in row order
+                if bound == score and self.row_keys[row] >= -negative_key_id:
+                    position = bisect_right(impacts, impacts[position], position)
+                    continue
+                bound = get_bound(position, row)
+                if bound < score or (bound == score and self.row_keys[row] >= -negative_key_id):
+                    position += 1
+                    continue
+            if checked == len(order) // 4:
+                return None
+            checked += 1
+            position += 1
+            found = self.find_postings(row, tokens)
+            if not self.match_row(row, clause, found):
+                continue
+
+            score = 0.0
+            for token, term_id in zip(tokens, term_ids):
+                score += self.get_impact(term_id, found[token])
+            key_id = self.row_keys[row]
+            old_score = key_scores.get(key_id)
+            if old_score is not None and score <= old_score:
+                continue
+            key_scores[key_id] = score
+            entry = (score, -key_id)
+            if old_score is not None and (old_score, -key_id) in top:
+                top[top.index((old_score, -key_id))] = entry
+                heapq.heapify(top)
+            elif len(top) < k:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+        return sorted(top, reverse=True)
+
+    def search(self, query, k=10):
+        """
+        Returns list of format [(key id, score)] of the k best-matching words, best first
+
+        String query: English words, all of which must match; "quoted phrases" must match
+            as a sequence, and OR separates alternatives, e.g. 'to study OR "to learn"'
+        int k: number of results; None for all of them
+        """
+        clauses = self.parse(query)
+        tokens = list(dict.fromkeys(token for clause in clauses for phrase in clause for token in phrase))
+        #with OR, the best rows of each clause compete, and walking by impact meets most rows anyway
+        ranked = self.search_top(clauses[0], tokens, k) if k is not None and len(clauses) == 1 else None
+        if ranked is None:
+            rows = set()
+            for clause in clauses:
+                rows.update(self.match_clause(clause))
+            #a word with several entries scores as its best entry
+            key_scores = {}
+            for row, score in self.score(rows, tokens).items():
+                key_id = self.row_keys[row]
+                if score > key_scores.get(key_id, -1.0):
+                    key_scores[key_id] = score
+            #ties are broken by load order
+            ranked = ((score, -key_id) for key_id, score in key_scores.items())
+            if k is None:
+                ranked = sorted(ranked, reverse=True)
+            else:
+                ranked = heapq.nlargest(k, ranked)
+        return [(-negative_key_id, score) for score, negative_key_id in ranked]
+
+class CDict:
+    """
+    Class for analyzing compound words using open-source CC-CEDICT dictionary.
+
+    Required for init: CC-CEDICT dictionary in CSV format.
+    
+    NOTE: If you have a copy of the dictionary in the standard .u8 format distributed
+    from the website, you can use the from_txt method to convert it.
+    """
+    def __init__(self, cedict_source, result_cache_size=1024, result_cache_ttl=None):
+        """
+        String cedict_source: path of the CC-CEDICT dictionary in CSV format
+        int result_cache_size: number of search() and get_compounds() results kept in memory (see ResultCache)
+        float result_cache_ttl: seconds a cached result stays valid, or None
+        """
+
+        #recent search() and get_compounds() results
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl)
+
+        #list of all unique Chinese characters in the dictionary
+        self.hanzi = []
+        #set version of self.hanzi, for fast membership checks while loading
+        hanzi_set = set()
+
+        #path of the CSV dictionary and its size and modification time, used to check snapshots
+        self.cedict_source = cedict_source
+        self.source_stat = get_source_stat(cedict_source)
+
+        #every distinct key and field is stored once, as a string id
+        string_ids = {}
+        #dictionary of format {key:[entries as arrays of string ids]}; a word might have more than one entry
+        key_entries = {}
+
+        #bitmask of format {key:FLAG_MARKERS found in the key's entries}
+        key_flags = defaultdict(int)
+        flag_bits = [(1 << bit, marker) for bit, marker in enumerate(FLAG_MARKERS.values())]
+
+        #open the CSV dictionary
+        with open(cedict_source, mode='r') as f:
+            reader = csv.reader(f)
+            for row in reader:
+                #the header row written by from_txt() is not an entry
+                if row[:3] == ['trad', 'simp', 'pinyin']:
+                    continue
+                #add unique Chinese characters to self.hanzi
+                if len(row[0]) == 1 and row[0] not in hanzi_set:
+                    hanzi_set.add(row[0])
+                    self.hanzi.append(row[0])
+                entry = array('i', [string_ids.setdefault(item, len(string_ids)) for item in row])
+                key_entries.setdefault(row[0], []).append(entry)
+
+                #classify the entry once; joining with a separator keeps markers from matching across fields
+                text = '\0'.join(row)
+                for bit, marker in flag_bits:
+                    if marker in text:
+                        key_flags[row[0]] |= bit
+
+        #list of all keys in load order; search results are returned in this order
+        self.keys = list(key_entries)
 
         #Length of longest entry; used for some methods
-        self.max_entry_len = max([len(key) for key in self.word_dict.keys()])
+        self.max_entry_len = max([len(key) for key in self.keys])
+
+        #entries of each key in load order, as CSR arrays: rows of key n are key_rows[n] to key_rows[n+1],
+        #fields of row n are the string ids fields[row_fields[n]:row_fields[n+1]]
+        key_rows = array('i', [0])
+        row_fields = array('i', [0])
+        fields = array('i')
+        for key in self.keys:
+            for entry in key_entries[key]:
+                fields.extend(entry)
+                row_fields.append(len(fields))
+            key_rows.append(len(row_fields) - 1)
+        del key_entries
+        blob, string_offsets = StringTable.build(string_ids)
+        self.entry_arrays = {'strings':blob, 'string_offsets':string_offsets,
+            'key_strings':array('i', [string_ids[key] for key in self.keys]),
+            'key_rows':key_rows, 'row_fields':row_fields, 'fields':fields}
+        del string_ids
+
+        #dictionary of format {flag:sorted array of ids of keys with that flag}, see FLAG_MARKERS
+        self.flag_ids = {flag:array('i') for flag in FLAG_MARKERS}
+        for key_id, key in enumerate(self.keys):
+            flags = key_flags.get(key, 0)
+            if flags:
+                for bit, flag in enumerate(FLAG_MARKERS):
+                    if flags & (1 << bit):
+                        self.flag_ids[flag].append(key_id)
+
+        #tries of key ids for '而*', '*而' and '*而*' searches respectively
+        self.prefix_trie, self.suffix_trie, self.infix_trie = self.get_search_tries()
+
+        #dictionary of the format {word:[list of all dictionary entries for that word]}, decoded on access
+        self.word_dict = self.get_entry_table()
+
+    def get_entry_table(self):
+        """
+        Returns read-only {word:[entries]} view over self.entry_arrays, used as self.word_dict
+        """
+        strings = StringTable(self.entry_arrays['strings'], self.entry_arrays['string_offsets'])
+        return EntryTable(strings, self.keys, self.entry_arrays['key_rows'], self.entry_arrays['row_fields'],
+            self.entry_arrays['fields'], self.prefix_trie)
 
-    @classmethod
-    def from_txt(self, txt, dest):
+    def get_compound_dict(self):
         """
-        Convert CC-CEDICT to CSV format.
+        Create (once) dictionary of format {char:[headwords]}, e.g. {'好':['你好', '好奇', ...]}, as a CompoundIndex
 
-        String txt: path of CC-CEDICT source file
-        String dest: path of destination file
+        Word ids in the index are the key ids used by search() and get_by_flag().
+        """
+        if getattr(self, 'compound_dict', None) is None:
+            self.compound_dict = CompoundIndex(self.keys)
+        return self.compound_dict
 
-        Assumes entries organized as follows:
-        trad simp [pinyin] /meaning1/meaning2/meaning3/meaning4/
+    def get_search_tries(self):
+        """
+        Create the tries used by search()
 
-        Example:
-        語言學 语言学 [yu3 yan2 xue2] /linguistics/
+        Prefix trie: every key, for '而*' queries
+        Suffix trie: every key reversed, for '*而' queries
+        Infix trie: every substring that neither starts nor ends the key, for '*而*' queries
+
+        Return type: (Trie, Trie, Trie)
+        """
+        return build_search_tries(self.keys)
+
+    def save_snapshot(self, path):
+        """
+        Save the dictionary and its search indexes to a binary snapshot file.
+
+        String path: path of destination file
+
+        The snapshot holds a string table, entry offsets and the prebuilt search tries,
+        all stored as flat int32 arrays. Load it with CDict.load_snapshot(), which
+        memory-maps the file instead of re-parsing the CSV, so worker processes share its pages.
+        The size, modification time and SHA-1 of the source CSV are recorded so
+        that a stale snapshot can be rejected.
+
+        The definition, simplified and pinyin indexes are not stored: a loaded snapshot builds
+        them from its entries on first use (see get_definition_index(), get_simp_index(), get_pinyin_index()),
+        in every process that uses them.
         """
-        csv_header = 'trad,simp,pinyin,def1,def2,def3,def4,def5,'+\
-            'def6,def7,def8,def9,def10,def11,def12,'+\
-            'def13,def14,def15,def16,def17,def18,def19,def20,def21,def22'
-        #The way the definitions are delineated
-        pattern1 = r'(\ \[)|(\] \/)|\/'
+        if get_source_stat(self.cedict_source) != self.source_stat:
+            raise ValueError("{0} has changed since it was loaded".format(self.cedict_source))
 
-        #Open source file
-        cedict_source = open(txt, 'r').read()
+        hanzi_set = set(self.hanzi)
+        hanzi = array('i', [key_id for key_id, key in enumerate(self.keys) if key in hanzi_set])
+
+        sections = dict(self.entry_arrays, hanzi=hanzi)
+        for trie_name in ('prefix_trie', 'suffix_trie', 'infix_trie'):
+            for name, values in getattr(self, trie_name).get_arrays().items():
+                sections[trie_name + '.' + name] = values
+        for flag, key_ids in self.flag_ids.items():
+            sections['flags.' + flag] = key_ids
 
-        #Open or create destination file
-        cedict_dest = open(dest, 'w')
+        source = {'path':os.path.abspath(self.cedict_source), 'size':self.source_stat[0],
+            'mtime_ns':self.source_stat[1], 'sha1':get_source_hash(self.cedict_source)}
+        write_snapshot(path, {'source':source, 'max_entry_len':self.max_entry_len}, sections)
 
-        #Remove comments from the beginning of the file
-        result0 = re.sub(r'#[^\n]*\n', r'', cedict_source)
+    @classmethod
+    def load_snapshot(cls, path, cedict_source=None, result_cache_size=1024, result_cache_ttl=None):
+        """
+        Load a dictionary saved with save_snapshot().
+
+        String path: path of snapshot file
+        String cedict_source: path of the CSV the snapshot was built from.
+        Defaults to the path recorded in the snapshot.
+        int result_cache_size, float result_cache_ttl: see CDict()
+
+        The file is memory-mapped read-only; entries are decoded when they are accessed,
+        so word_dict and keys are read-only views rather than a dict and a list.
+        Raises ValueError if the source CSV has changed since the snapshot was saved.
+        If only its modification time changed (e.g. it was copied or touched), the CSV is hashed
+        to check, on every load until the snapshot is saved again; a warning says so.
+        """
+        header, sections, buffer = read_snapshot(path)
+        source = header['source']
+        if cedict_source is None:
+            cedict_source = source['path']
+
+        #a changed size or modification time only means a stale snapshot if the contents changed too
+        source_stat = get_source_stat(cedict_source)
+        if source_stat != (source['size'], source['mtime_ns']):
+            if get_source_hash(cedict_source) != source['sha1']:
+                raise ValueError("Snapshot {0} is stale: {1} has changed".format(path, cedict_source))
+            warnings.warn("{0} was modified but its contents are unchanged; save snapshot {1} again "
+                "to skip hashing it on every load".format(cedict_source, path), stacklevel=2)
+
+        cdict = cls.__new__(cls)
+        cdict.result_cache = ResultCache(result_cache_size, result_cache_ttl)
+        cdict.snapshot = buffer
+        cdict.cedict_source = cedict_source
+        cdict.source_stat = source_stat
+        cdict.max_entry_len = header['max_entry_len']
+
+        cdict.entry_arrays = {name:sections[name] for name in
+            ('strings', 'string_offsets', 'key_strings', 'key_rows', 'row_fields', 'fields')}
+        #keys are a view into the string table, in load order
+        cdict.keys = StringTable(sections['strings'], sections['string_offsets'], sections['key_strings'])
+
+        for trie_name in ('prefix_trie', 'suffix_trie', 'infix_trie'):
+            arrays = {name:sections[trie_name + '.' + name] for name in Trie.array_names}
+            setattr(cdict, trie_name, Trie(arrays))
+
+        cdict.word_dict = cdict.get_entry_table()
+        cdict.hanzi = [cdict.keys[key_id] for key_id in sections['hanzi']]
+        cdict.flag_ids = {name[len('flags.'):]:values for name, values in sections.items() if name.startswith('flags.')}
+        return cdict
 
-        #Replace definition delineation with commas
-        result1 = re.sub(pattern1, ',', result0)
+    @classmethod
+    def from_txt(cls, txt, dest):
+        """
+        Convert CC-CEDICT to CSV format.
 
-        #Split lines
-        result2 = re.sub('/\n', '\n', result1)
+        String txt: path of CC-CEDICT source file
+        String dest: path of destination file
 
-        #The way the traditional characters, simplified characters, and pinyin are delineated
-        #NOTE: This regex is from a summer project, and I didn't come up with it completely on my own. 
-        #I figured out the individual elements but got help putting them together
-        result3 = re.sub(r"([\u3300-\u9fff]+)\s+(?:[a-z]+)?([\u3300-\u9fff]+)", r"\1,\2", result2, 0, re.IGNORECASE)
+        Assumes entries organized as follows:
+        trad simp [pinyin] /meaning1/meaning2/meaning3/meaning4/
 
-        #Write the CSV header
-        cedict_dest.write(csv_header)
+        Example:
+        語言學 语言学 [yu3 yan2 xue2] /linguistics/
 
-        #Write to the destination file
-        cedict_dest.write(result3)
+        The source file can be plain text, gzip (.gz) or a zip archive holding the .u8 file.
+        It is converted one line at a time, so memory use stays flat however large it is.
 
-        #Close the file
-        cedict_dest.close()    
+        Return type: dict of format {'entries':# rows written, 'comments':# comment or blank lines,
+        'malformed':# lines that didn't match the format above}
+        """
+        csv_header = ['trad', 'simp', 'pinyin'] + ['def' + str(n) for n in range(1, 23)]
+        counts = {'entries':0, 'comments':0, 'malformed':0}
+
+        with open_cedict_txt(txt) as cedict_source, open(dest, 'w', newline='', encoding='utf-8') as cedict_dest:
+            writer = csv.writer(cedict_dest)
+            writer.writerow(csv_header)
+            for line in cedict_source:
+                #skip comments and blank lines
+                if line.startswith('#') or not line.strip():
+                    counts['comments'] += 1
+                    continue
+                match = CEDICT_LINE.match(line)
+                if match is None:
+                    counts['malformed'] += 1
+                    continue
+                trad, simp, pinyin, definitions = match.groups()
+                writer.writerow([trad, simp, pinyin] + definitions.split('/'))
+                counts['entries'] += 1
+        return counts
 
     def search(self, query):
         """
@@ -331,73 +2536,206 @@ class CDict:
         '而*' matches words starting with '而': '而且', etc. 
         '*而' matches words ending with '而': '因而', etc.
         '*而*'matches words that have '而' in the middle: '不翼而飛', etc.
+
+        Recent results are cached (see ResultCache); the entry lists are shared, so don't modify them.
         """
+        return self.search_many([query])[0]
 
-        #if first and last char in query is *, find all words with query in the middle
-        if query.startswith('*') and query.endswith('*'):
-            result = [self.word_dict[key] for key in self.word_dict.keys() if query[1:-1] in key \
-                and not key.startswith(query[1:-1]) and not key.endswith(query[1:-1])]
+    def get_compounds(self, query):
+        """
+        Returns a list of compounds including the query
+        """
+        return self.get_compounds_many([query])[0]
 
-        #if first char in query is *, find all words ending with the query
-        elif query.startswith('*'):
-            result = [self.word_dict[key] for key in self.word_dict.keys() if key.endswith(query[1:])]
+    def search_many(self, queries):
+        """
+        Search for many queries at once; see search()
 
-        #if last char in query is *, find all words starting with the query
-        elif query.endswith('*'):
-            result = [self.word_dict[key] for key in self.word_dict.keys() if key.startswith(query[:-1])]
+        Each distinct query is answered once, and queries sharing a prefix (or suffix, for '*而')
+        share one walk of the search trie. Queries found in the result cache are not searched again.
 
-        #if no * in query, find all words starting with the query
-        else:
-            result = [self.word_dict[key] for key in self.word_dict.keys() if key.startswith(query)]
-        return result
+        Return type: list of search() results, one per query, in the order given
+        """
+        return self.get_cached_many('search', queries, self.word_dict.get_entries)
 
-    def get_compounds(self, query):
+    def get_compounds_many(self, queries):
         """
-        Returns a list of compounds including the query
+        Returns a list of get_compounds() results, one per query, in the order given; see search_many()
+        """
+        return self.get_cached_many('compounds', queries, self.keys.__getitem__)
+
+    def get_cache_token(self):
+        """
+        Returns what cached search results depend on; replacing the entries or the tries changes it
+        """
+        return (self.word_dict, self.prefix_trie, self.suffix_trie, self.infix_trie)
+
+    def get_cached_many(self, kind, queries, decode):
+        """
+        Returns the results of many wildcard queries, from the result cache where possible
+
+        String kind: name the results are cached under, e.g. 'search'
+        list queries: wildcard queries, see search()
+        function decode: turns a matching key id into a result item
+        """
+        token = self.get_cache_token()
+        results = {query:self.result_cache.get((kind, query), token) for query in dict.fromkeys(queries)}
+        missing = [query for query, result in results.items() if result is None]
+        if missing:
+            found = search_tries_many(missing, self.keys, self.prefix_trie, self.suffix_trie, self.infix_trie)
+            for query, key_ids in found.items():
+                results[query] = [decode(key_id) for key_id in key_ids]
+                self.result_cache.put((kind, query), token, results[query])
+        #a new outer list each time, so callers can't change the cached one
+        return [list(results[query]) for query in queries]
+
+    def get_simp_index(self):
+        """
+        Create (once) the FormIndex of entries by simplified form (row[1])
+        """
+        if getattr(self, 'simp_index', None) is None:
+            self.simp_index = FormIndex(self.word_dict.get_field(row, 1) \
+                for row in range(self.word_dict.get_row_count()))
+        return self.simp_index
+
+    def get_pinyin_index(self, tones=True):
+        """
+        Create (once) the FormIndex of entries by normalized pinyin (row[2]); see normalize_pinyin()
+
+        bool tones: index pinyin with tone numbers, or without them for tone-insensitive lookups
+        """
+        name = 'pinyin_index' if tones else 'toneless_pinyin_index'
+        if getattr(self, name, None) is None:
+            setattr(self, name, FormIndex(normalize_pinyin(self.word_dict.get_field(row, 2), tones) \
+                for row in range(self.word_dict.get_row_count())))
+        return getattr(self, name)
+
+    def lookup_simp(self, word):
+        """
+        Returns list of CC-CEDICT entries whose simplified form is word, e.g. '语言' gives the entry for '語言'
+        """
+        return [self.word_dict.get_row(row) for row in self.get_simp_index().lookup(word)]
+
+    def lookup_pinyin(self, pinyin, tones=True):
+        """
+        Returns list of CC-CEDICT entries read as pinyin
+
+        String pinyin: pinyin with tone numbers and spaces between syllables, e.g. 'yu3 yan2'
+        bool tones: if False, tone numbers are ignored, so 'yu yan' also matches '語言' and '寓言'
+        """
+        return [self.word_dict.get_row(row) for row in self.get_pinyin_index(tones).lookup(normalize_pinyin(pinyin, tones))]
+
+    def search_simp(self, query):
+        """
+        Search for entries whose simplified form matches query; '*' is a wildcard as in search()
+
+        Return type: list of CC-CEDICT entries, in load order
+        """
+        return [self.word_dict.get_row(row) for row in self.get_simp_index().search(query)]
+
+    def search_pinyin(self, query, tones=True):
+        """
+        Search for entries whose pinyin matches query; '*' is a wildcard as in search()
+
+        e.g. 'yu3 *' matches all words starting with the syllable yu3
+
+        Return type: list of CC-CEDICT entries, in load order
+        """
+        return [self.word_dict.get_row(row) for row in self.get_pinyin_index(tones).search(normalize_pinyin(query, tones))]
+
+    def to_simplified(self, text):
+        """
+        Convert traditional characters in text to simplified characters.
+
+        Uses the longest dictionary word at each position, so phrase-level mappings such as
+        '乾隆' -> '乾隆' (not '干隆') win over single characters. Characters not in the
+        dictionary are kept as they are.
+        """
+        def convert(key_id):
+            return self.word_dict.get_field(self.entry_arrays['key_rows'][key_id], 1)
+        return self.convert_text(text, self.prefix_trie, convert)
+
+    def to_traditional(self, text):
+        """
+        Convert simplified characters in text to traditional characters; see to_simplified()
+
+        Where a simplified word has more than one traditional form, the first one in the dictionary is used.
         """
-        return [result[0][0] for result in self.search(query)]        
+        simp_index = self.get_simp_index()
+        prefix_trie = simp_index.get_search_tries()[0]
+        def convert(form_id):
+            return self.word_dict.get_field(simp_index.rows[simp_index.offsets[form_id]], 0)
+        return self.convert_text(text, prefix_trie, convert)
+
+    @staticmethod
+    def convert_text(text, trie, convert):
+        """
+        Returns text with every longest match in trie replaced by convert(match id)
+        """
+        pieces = []
+        start = 0
+        while start < len(text):
+            length, match_id = trie.longest_match(text, start)
+            converted = convert(match_id) if length else ''
+            #keep the text as it is if there is no match, or the entry has no form to convert to
+            if not converted or len(converted) != length:
+                length = length or 1
+                converted = text[start:start + length]
+            pieces.append(converted)
+            start += length
+        return ''.join(pieces)
+
+    def get_definition_index(self):
+        """
+        Create (once) the DefinitionIndex of words in the English definitions, used by search_definitions()
+        """
+        if getattr(self, 'definition_index', None) is None:
+            self.definition_index = DefinitionIndex(self.word_dict)
+        return self.definition_index
+
+    def search_definitions(self, query, k=10):
+        """
+        Reverse lookup: find words by their English definitions.
+
+        String query: English words, all of which must appear in the definitions, e.g. 'red wine'
+            "Quoted phrases" must appear as written, and OR gives alternatives: 'beer OR "red wine"'
+        int k: number of results; None for all matches
+
+        Return type: list of format [(word, score)], best match first
+        """
+        return [(self.keys[key_id], score) for key_id, score in self.get_definition_index().search(query, k)]
+
+    def get_by_flag(self, flag, hanzi_only=False):
+        """
+        Returns list of words whose entries are marked with flag, in load order
+
+        String flag: one of the names in FLAG_MARKERS, e.g. 'idiom', 'variant', 'surname'
+        bool hanzi_only: only return single characters
+        """
+        if flag not in self.flag_ids:
+            raise ValueError("Unknown flag {0}; expected one of {1}".format(flag, list(self.flag_ids)))
+        words = [self.keys[key_id] for key_id in self.flag_ids[flag]]
+        if hanzi_only:
+            words = [word for word in words if len(word) == 1]
+        return words
 
     def get_idioms(self):
         """
         Returns list of idioms (chengyu) in the dictionary
         """
-        idioms = []
-        for key in self.word_dict.keys():
-            is_idiom = False
-            for entry in self.word_dict[key]:
-                for item in entry:
-                    if '(idiom)' in item:
-                        is_idiom = True
-            if is_idiom: idioms.append(key)
-        return idioms
+        return self.get_by_flag('idiom')
 
     def get_variants(self):
         """
         Returns list of character variants (archaic, etc.) in the dictionary
         """
-        variants = []
-        for zi in self.hanzi:
-            is_variant = False
-            for entry in self.word_dict[zi]:
-                for item in entry:
-                    if 'variant' in item:
-                        is_variant = True
-            if is_variant: variants.append(zi)
-        return variants
+        return self.get_by_flag('variant', hanzi_only=True)
 
     def get_gugja(self):
         """
         Returns list of gugja (special hanzi for Korean) in the dictionary
         """
-        gugja = []
-        for zi in self.hanzi:
-            is_gugja = False
-            for entry in self.word_dict[zi]:
-                for item in entry:
-                    if 'gugja' in item:
-                        is_gugja = True
-            if is_gugja: gugja.append(zi)
-        return gugja
+        return self.get_by_flag('gugja', hanzi_only=True)
 
     def get_nonrare(self):
         """
@@ -409,3 +2747,471 @@ class CDict:
         rare_set = variants_set | gugja_set
         nonrare_set = hanzi_set - rare_set
         return nonrare_set
+
+    def get_segmenter(self, mode='forward', freqs=None):
+        """
+        Returns a Segmenter for splitting unsegmented text into the dictionary's words
+
+        String mode: 'forward' or 'backward' maximum matching, or 'dag' (see Segmenter)
+        dict freqs: optional word counts of format {word:count}, used by 'dag' mode
+        """
+        return Segmenter(self, mode, freqs)
+
+#Runs of text the segmenter works on: anything between whitespace
+SEGMENT_RUN = re.compile(r'\S+')
+
+class Segmenter:
+    """
+    Dictionary-driven word segmenter for unsegmented Chinese text, using CDict headwords.
+
+    Compiles an Aho-Corasick automaton over the headwords, so one pass over the text finds every
+    dictionary word in it. No match can be longer than CDict.max_entry_len, the depth of the automaton.
+    Then splits the text using one of three modes:
+    'forward': forward maximum matching, taking the longest word starting at each position
+    'backward': backward maximum matching, taking the longest word ending at each position
+    'dag': the path through all dictionary words in the text with the highest total log frequency
+
+    Characters not covered by any word become one-character words, except runs of ASCII letters
+    and digits, which are kept together.
+    """
+
+    def __init__(self, cdict, mode='forward', freqs=None):
+        """
+        CDict cdict: dictionary whose headwords are the vocabulary
+        String mode: 'forward', 'backward' or 'dag'
+        dict freqs: word counts of format {word:count} for 'dag' mode, e.g. collections.Counter(sinica.words()).
+        Defaults to a count of 1 for every headword, which favours the fewest, longest words.
+        """
+        if mode not in ('forward', 'backward', 'dag'):
+            raise ValueError("Unknown mode {0}; expected 'forward', 'backward' or 'dag'".format(mode))
+        self.mode = mode
+        self.max_entry_len = cdict.max_entry_len
+
+        #log probability of each word for 'dag' mode; unknown words count as seen half as often as the rarest one
+        self.freqs = freqs
+        if freqs:
+            total = sum(freqs.values())
+            self.log_total = math.log(total)
+            self.log_unknown = math.log(min(freqs.values()) / 2)
+        else:
+            self.log_total = math.log(len(cdict.keys))
+            self.log_unknown = math.log(0.5)
+
+        self.goto, self.fail, self.output, self.depth = self.get_automaton(cdict.prefix_trie)
+
+    @staticmethod
+    def get_automaton(trie):
+        """
+        Compile an Aho-Corasick automaton from a frozen prefix trie. Its nodes are numbered breadth-first,
+        so every node's failure link is computed before its children's.
+
+        Return type: (goto, fail, output, depth)
+        goto: dictionary of format {node * 0x110000 + code point:child node}
+        fail: failure link of each node, the node for its longest proper suffix in the trie
+        output: each node's nearest node on the failure chain, itself included, that ends a headword, or 0
+        depth: length of the string each node stands for
+        """
+        n_nodes = len(trie.terminals)
+        goto = {}
+        fail = array('i', bytes(4 * n_nodes))
+        output = array('i', bytes(4 * n_nodes))
+        depth = array('i', bytes(4 * n_nodes))
+
+        for node in range(n_nodes):
+            for i in range(trie.child_offsets[node], trie.child_offsets[node + 1]):
+                code = trie.child_chars[i]
+                child = trie.child_nodes[i]
+                goto[node * 0x110000 + code] = child
+                depth[child] = depth[node] + 1
+                if node:
+                    #follow the parent's failure links until one can be extended by this char
+                    suffix = fail[node]
+                    while suffix and suffix * 0x110000 + code not in goto:
+                        suffix = fail[suffix]
+                    fail[child] = goto.get(suffix * 0x110000 + code, 0)
+            if node:
+                output[node] = node if trie.terminals[node] != -1 else output[fail[node]]
+        return goto, fail, output, depth
+
+    def get_matches(self, text):
+        """
+        Find every headword in text in one pass.
+
+        Return type: list of format [[end positions]], one list per start position;
+        text[start:end] is a headword for each end in the list at start
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        depth = self.depth
+        matches = [[] for char in text]
+        node = 0
+        for end, char in enumerate(text, 1):
+            code = ord(char)
+            while True:
+                child = goto.get(node * 0x110000 + code)
+                if child is not None:
+                    node = child
+                    break
+                if not node:
+                    break
+                node = fail[node]
+            match = output[node]
+            while match:
+                matches[end - depth[match]].append(end)
+                match = output[fail[match]]
+        return matches
+
+    @staticmethod
+    def get_fallback_end(text, start):
+        """
+        Returns the end of the unknown word starting at start: a run of ASCII letters and digits, or one char
+        """
+        end = start + 1
+        if text[start].isascii() and text[start].isalnum():
+            while end < len(text) and text[end].isascii() and text[end].isalnum():
+                end += 1
+        return end
+
+    def segment_run(self, text):
+        """
+        Segment a string with no whitespace.
+
+        Return type: list of words
+        """
+        matches = self.get_matches(text)
+        words = []
+
+        if self.mode == 'forward':
+            start = 0
+            while start < len(text):
+                end = max(matches[start]) if matches[start] else self.get_fallback_end(text, start)
+                words.append(text[start:end])
+                start = end
+
+        elif self.mode == 'backward':
+            #longest headword ending at each position
+            longest = [0] * (len(text) + 1)
+            for start, ends in enumerate(matches):
+                for end in ends:
+                    if end - start > longest[end]:
+                        longest[end] = end - start
+            end = len(text)
+            while end > 0:
+                start = end - longest[end] if longest[end] else end - 1
+                #keep ASCII runs together, as in forward mode
+                if not longest[end] and text[start].isascii() and text[start].isalnum():
+                    while start > 0 and text[start - 1].isascii() and text[start - 1].isalnum():
+                        start -= 1
+                words.append(text[start:end])
+                end = start
+            words.reverse()
+
+        else:
+            #best[start] = (best total log probability of text[start:], end of the first word on that path)
+            best = [(0.0, len(text))] * (len(text) + 1)
+            for start in range(len(text) - 1, -1, -1):
+                candidates = []
+                for end in matches[start] or [self.get_fallback_end(text, start)]:
+                    log_freq = self.get_log_freq(text[start:end])
+                    candidates.append((log_freq - self.log_total + best[end][0], end))
+                best[start] = max(candidates)
+            start = 0
+            while start < len(text):
+                end = best[start][1]
+                words.append(text[start:end])
+                start = end
+        return words
+
+    def get_log_freq(self, word):
+        """
+        Returns log count of word for 'dag' mode
+        """
+        if self.freqs is None:
+            return 0.0
+        count = self.freqs.get(word)
+        return math.log(count) if count else self.log_unknown
+
+    def segment(self, text):
+        """
+        Segment a string into words; whitespace separates words too and is dropped.
+
+        Return type: list of words
+        """
+        words = []
+        for run in SEGMENT_RUN.findall(text):
+            words.extend(self.segment_run(run))
+        return words
+
+    def segment_lines(self, lines):
+        """
+        Generator: segment each line of an iterable of strings, e.g. an open file
+
+        Yields a list of words per non-empty line, which can be used as a sentence.
+        """
+        for line in lines:
+            words = self.segment(line)
+            if words:
+                yield words
+
+    def segment_file(self, path, encoding='utf-8'):
+        """
+        Generator: segment a text file one line at a time, so memory use doesn't depend on the file size
+
+        String path: path of a UTF-8 text file, one sentence or paragraph per line
+        """
+        with open(path, 'r', encoding=encoding) as f:
+            yield from self.segment_lines(f)
+
+class SegmentedCorpus:
+    """
+    Corpus reader over raw text files, segmented with a Segmenter, for SinicaPOS and SinicaVec
+    in place of a treebank reader.
+
+    sents() can be iterated more than once (Word2Vec needs several passes); each pass re-reads
+    and re-segments the files instead of keeping them in memory. The text has no POS tags,
+    so tagged_words() pairs every word with the tag None.
+    """
+
+    def __init__(self, segmenter, paths, encoding='utf-8'):
+        """
+        Segmenter segmenter: segmenter to split the text with
+        list paths: paths of UTF-8 text files (or a single path)
+        """
+        self.segmenter = segmenter
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.encoding = encoding
+
+    def __iter__(self):
+        for path in self.paths:
+            yield from self.segmenter.segment_file(path, self.encoding)
+
+    def sents(self):
+        return self
+
+    def words(self):
+        return ReIterable(lambda: (word for sent in self for word in sent))
+
+    def tagged_words(self):
+        return ReIterable(lambda: ((word, None) for sent in self for word in sent))
+
+    def tagged_sents(self):
+        return ReIterable(lambda: ([(word, None) for word in sent] for sent in self))
+
+class ReIterable:
+    """
+    Iterable that calls a generator function each time it is iterated, so it can be read more than once
+    """
+
+    def __init__(self, generator_function):
+        self.generator_function = generator_function
+
+    def __iter__(self):
+        return self.generator_function()
+
+class Profiler:
+    """
+    Per-method wall time, call counts, items handled and counters, recorded by enable_profiling().
+
+    Every call is also kept (up to max_events) as a Chrome trace event, so a run can be viewed
+    in chrome://tracing or Perfetto with write_trace().
+    """
+
+    def __init__(self, max_events=1000000):
+        """
+        int max_events: most trace events kept; later calls are still counted in the stats
+        """
+        self.max_events = max_events
+        self.start = time.perf_counter()
+        #dictionary of format {name:{'calls':n, 'seconds':total, 'max':longest call, 'items':n}}
+        self.stats = {}
+        #dictionary of format {counter:n}, e.g. {'ResultCache.hits':n}
+        self.counters = defaultdict(int)
+        self.events = []
+        self.dropped_events = 0
+        self.lock = threading.Lock()
+
+    def record(self, name, start, stop, items=None, counter=None):
+        """
+        Record one call of name that ran from start to stop (time.perf_counter() values)
+        """
+        seconds = stop - start
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = {'calls':0, 'seconds':0.0, 'max':0.0, 'items':0}
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if items is not None:
+                stats['items'] += items
+            if counter is not None:
+                self.counters[counter] += 1
+            if len(self.events) < self.max_events:
+                self.events.append((name, start, seconds, threading.get_ident(), items))
+            else:
+                self.dropped_events += 1
+
+    def get_stats(self):
+        """
+        Return type: dict of format {'methods':{name:{'calls', 'seconds', 'mean', 'max', 'items'}}, 'counters':{...}},
+        methods with the most total time first
+        """
+        with self.lock:
+            methods = {name:dict(stats, mean=stats['seconds'] / stats['calls']) for name, stats in \
+                sorted(self.stats.items(), key=lambda x:x[1]['seconds'], reverse=True)}
+            return {'methods':methods, 'counters':dict(self.counters), 'dropped_events':self.dropped_events}
+
+    def write_stats(self, path):
+        """
+        Write get_stats() as JSON to path
+        """
+        with open(path, 'w') as f:
+            json.dump(self.get_stats(), f, indent=2)
+
+    def get_trace(self):
+        """
+        Returns the recorded calls in Chrome trace-event format, with times in microseconds
+        """
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        trace = []
+        for name, start, seconds, thread, items in events:
+            event = {'name':name, 'cat':name.split('.')[0], 'ph':'X', 'pid':pid, 'tid':thread,
+                'ts':(start - self.start) * 1e6, 'dur':seconds * 1e6}
+            if items is not None:
+                event['args'] = {'items':items}
+            trace.append(event)
+        return {'traceEvents':trace, 'displayTimeUnit':'ms'}
+
+    def write_trace(self, path):
+        """
+        Write get_trace() as JSON to path, for chrome://tracing or https://ui.perfetto.dev
+        """
+        with open(path, 'w') as f:
+            json.dump(self.get_trace(), f)
+
+#Functions and methods instrumented by enable_profiling(), of format
+#[(class name or None for module functions, attribute, items function or None, counter function or None)].
+#An items function gets (args, result) and returns how many items the call handled;
+#a counter function gets (args, result) and returns the name of a counter to increment.
+PROFILED = [
+    ('CDict', '__init__', lambda args, result: len(args[0].keys), None),
+    ('CDict', 'load_snapshot', lambda args, result: len(result.keys), None),
+    ('CDict', 'from_txt', lambda args, result: result['entries'], None),
+    (None, 'build_search_tries', lambda args, result: len(args[0]), None),
+    ('CDict', 'search_many', lambda args, result: sum(len(entries) for entries in result), None),
+    ('CDict', 'get_compounds_many', lambda args, result: sum(len(words) for words in result), None),
+    ('CDict', 'search_definitions', lambda args, result: len(result), None),
+    ('CDict', 'get_by_flag', lambda args, result: len(result), None),
+    ('DefinitionIndex', '__init__', lambda args, result: len(args[0].row_keys), None),
+    ('FormIndex', '__init__', lambda args, result: len(args[0].forms), None),
+    ('Segmenter', 'segment', lambda args, result: len(result), None),
+    ('CompoundIndex', 'extend', lambda args, result: len(result), None),
+    ('SinicaPOS', 'build_indexes', lambda args, result: len(args[0].seen_pairs), None),
+    ('SinicaPOS', 'add_pairs', None, None),
+    ('SinicaPOS', 'build_summaries', lambda args, result: len(args[0].hanzi), None),
+    ('SinicaPOS', 'from_files', lambda args, result: len(args[1]), None),
+    ('SinicaVec', 'load_model', None, None),
+    ('SinicaVec', 'update', lambda args, result: len(result), None),
+    ('SinicaVec', 'get_similarity_index', None, None),
+    ('SinicaVec', 'compute_compound_similarity_list', lambda args, result: len(result), None),
+    ('SinicaVec', 'compute_compound_similarity_lists', lambda args, result: sum(len(sl) for sl in result), None),
+    ('SinicaVec', 'get_avg_similarities', lambda args, result: len(result[0]), None),
+    ('ResultCache', 'get', None,
+        lambda args, result: 'ResultCache.misses' if result is (args[3] if len(args) > 3 else None) else 'ResultCache.hits'),
+    ('ProductivitySketch', 'add_words', None, None),
+]
+
+#the active Profiler, and the original functions it replaced, of format {(class name, attribute):original}
+profiler = None
+profiled_originals = {}
+
+def get_timed(name, function, items, counter, recorder):
+    """
+    Returns function wrapped to record each call in the Profiler recorder under name
+    """
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        stop = time.perf_counter()
+        recorder.record(name, start, stop, items(args, result) if items else None,
+            counter(args, result) if counter else None)
+        return result
+    return timed
+
+def enable_profiling(max_events=1000000):
+    """
+    Start recording the functions and methods in PROFILED; returns the Profiler.
+
+    The methods are replaced with timed wrappers only while profiling is on, so there is no
+    cost at all when it is off. Only the calling process is recorded, not pool workers.
+
+    Return type: Profiler
+    """
+    global profiler
+    if profiler is not None:
+        return profiler
+    profiler = Profiler(max_events)
+    module = sys.modules[__name__]
+    for class_name, attribute, items, counter in PROFILED:
+        owner = module if class_name is None else getattr(module, class_name)
+        original = owner.__dict__[attribute] if class_name is not None else getattr(module, attribute)
+        profiled_originals[(class_name, attribute)] = original
+        name = attribute if class_name is None else class_name + '.' + attribute
+        if isinstance(original, (classmethod, staticmethod)):
+            wrapped = type(original)(get_timed(name, original.__func__, items, counter, profiler))
+        else:
+            wrapped = get_timed(name, original, items, counter, profiler)
+        setattr(owner, attribute, wrapped)
+    return profiler
+
+def disable_profiling():
+    """
+    Restore the original functions and methods; returns the Profiler that was recording, or None
+    """
+    global profiler
+    module = sys.modules[__name__]
+    for (class_name, attribute), original in profiled_originals.items():
+        setattr(module if class_name is None else getattr(module, class_name), attribute, original)
+    profiled_originals.clear()
+    finished, profiler = profiler, None
+    return finished
+
+def main(argv=None):
+    """
+    Run a Python script with profiling enabled, then write the stats and optionally a Chrome trace.
+
+    (Unix terminal examples)
+        python chinese_roots.py --profile stats.json test.py
+        python chinese_roots.py --profile stats.json --trace trace.json benchmark.py --sections cdict
+    """
+    import argparse, runpy
+    parser = argparse.ArgumentParser(description='Run a script that uses chinese_roots with profiling hooks enabled.')
+    parser.add_argument('--profile', required=True, help='write per-method stats as JSON to this file')
+    parser.add_argument('--trace', help='also write a Chrome trace-event JSON file')
+    parser.add_argument('script', help='Python script to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the script')
+    args = parser.parse_args(argv)
+
+    #the script imports chinese_roots by name, which is a different module object from this __main__
+    module = importlib.import_module('chinese_roots')
+    recorder = module.enable_profiling()
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    try:
+        runpy.run_path(args.script, run_name='__main__')
+    except SystemExit as error:
+        if error.code not in (None, 0):
+            raise
+    finally:
+        module.disable_profiling()
+        recorder.write_stats(args.profile)
+        if args.trace:
+            recorder.write_trace(args.trace)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""
+Description: Asyncio lookup service for the Chinese words and roots toolkit
+
+Serves one shared CDict (and optionally one SinicaVec) as JSON over HTTP. Concurrent requests
+of the same kind are collected into micro-batches and answered with one batch call
+(CDict.search_many, SinicaVec.get_compound_similarity_lists) on a worker pool, so the event
+loop never blocks on a lookup. When too many requests are waiting, new ones get
+503 Service Unavailable instead of queueing without bound.
+
+(Unix terminal examples)
+    python server.py --cedict cedict.csv --port 8080
+    python server.py --snapshot cedict.snap --sinica --cache-dir models --workers 4
+    curl 'localhost:8080/compounds?q=而*'
+    curl 'localhost:8080/similarity?word=建造&n=10'
+    curl 'localhost:8080/stats'
+
+Endpoints (GET; '*' wildcards as in CDict.search):
+    /search?q=          CC-CEDICT entries matching q
+    /compounds?q=       headwords matching q
+    /definitions?q=&k=  reverse lookup by English definition
+    /similarity?word=&n=        the n words sharing roots with word that are most similar to it
+    /avg_similarity?word=       average similarity of word to the words sharing its roots
+    /stats              request counts, batch sizes, result cache counters and latency percentiles
+"""
+
+import argparse, asyncio, json, math, sys, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import chinese_roots
+
+class LatencyStats:
+    """
+    Counts and latencies of requests, per endpoint; percentiles are over the most recent requests.
+    """
+
+    def __init__(self, window=10000):
+        """
+        int window: number of recent latencies kept per endpoint
+        """
+        self.window = window
+        #dictionary of format {endpoint:deque of latencies in seconds}
+        self.latencies = {}
+        #dictionary of format {endpoint:{status:count}}
+        self.counts = {}
+
+    def record(self, endpoint, status, seconds):
+        self.latencies.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+        statuses = self.counts.setdefault(endpoint, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    @staticmethod
+    def get_percentiles(values, percentiles=(50, 90, 99)):
+        """
+        Returns dictionary of format {'p50':milliseconds, ...} using the nearest-rank method
+        """
+        values = sorted(values)
+        if not values:
+            return {}
+        #the p-th percentile is the smallest value with at least p% of the values at or below it
+        return {'p{0}'.format(p):values[max(0, math.ceil(len(values) * p / 100) - 1)] * 1000 for p in percentiles}
+
+    def get_stats(self):
+        """
+        Return type: dict of format {endpoint:{'count':n, 'status':{status:n}, 'p50':ms, 'p90':ms, 'p99':ms, 'max':ms}}
+        """
+        stats = {}
+        for endpoint, latencies in self.latencies.items():
+            stats[endpoint] = dict(self.get_percentiles(latencies), count=sum(self.counts[endpoint].values()),
+                status=self.counts[endpoint], max=max(latencies) * 1000)
+        return stats
+
+class MicroBatcher:
+    """
+    Collects items submitted concurrently and passes them to a batch function together.
+
+    A batch is sent when it reaches max_batch items or max_delay seconds after its first item,
+    whichever comes first. Batches run on an executor, at most max_running at a time.
+    """
+
+    def __init__(self, func, executor, max_batch=64, max_delay=0.002, max_running=1):
+        """
+        function func: takes a list of items and returns a list of results in the same order
+        Executor executor: pool the batches run on
+        int max_batch: largest batch
+        float max_delay: longest time, in seconds, the first item of a batch waits for others
+        int max_running: number of batches allowed to run at the same time
+        """
+        self.func = func
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.running = asyncio.Semaphore(max_running)
+        self.queue = asyncio.Queue()
+        self.batch_sizes = deque(maxlen=10000)
+        self.task = None
+
+    async def submit(self, item):
+        """
+        Returns the result for item once its batch has run
+        """
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.collect())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            #wait for a free slot here, so items keep collecting into the next batch meanwhile
+            await self.running.acquire()
+            asyncio.ensure_future(self.run(batch))
+
+    async def run(self, batch):
+        loop = asyncio.get_running_loop()
+        self.batch_sizes.append(len(batch))
+        try:
+            results = await loop.run_in_executor(self.executor, self.func, [item for item, future in batch])
+        except Exception as error:
+            for item, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for (item, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.running.release()
+
+    def get_stats(self):
+        sizes = self.batch_sizes
+        return {'batches':len(sizes), 'mean_size':sum(sizes) / len(sizes) if sizes else 0,
+            'max_size':max(sizes) if sizes else 0, 'queued':self.queue.qsize()}
+
+class LookupService:
+    """
+    HTTP front end for one shared CDict and SinicaVec.
+    """
+
+    def __init__(self, cdict, vec=None, workers=4, max_pending=1000, max_batch=64, max_delay=0.002):
+        """
+        CDict cdict: dictionary to serve
+        SinicaVec vec: model for the similarity endpoints, or None to disable them
+        int workers: threads lookups run on
+        int max_pending: requests allowed in progress at once; more get 503 responses
+        int max_batch, float max_delay: micro-batch limits, see MicroBatcher
+        """
+        self.cdict = cdict
+        self.vec = vec
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.started = time.time()
+        self.stats = LatencyStats()
+        #threads, not processes: every worker reads the same dictionary and model, and NumPy
+        #releases the GIL during the matrix products that dominate similarity batches
+        self.executor = ThreadPoolExecutor(workers)
+        self.batchers = {
+            'search':MicroBatcher(cdict.search_many, self.executor, max_batch, max_delay, workers),
+            'compounds':MicroBatcher(cdict.get_compounds_many, self.executor, max_batch, max_delay, workers)}
+        if vec is not None:
+            self.batchers['similarity'] = MicroBatcher(self.get_similarity_lists, self.executor, max_batch,
+                max_delay, workers)
+        self.routes = {'/search':self.search, '/compounds':self.compounds, '/definitions':self.definitions,
+            '/similarity':self.similarity, '/avg_similarity':self.avg_similarity, '/stats':self.get_stats}
+
+    def get_similarity_lists(self, words):
+        """
+        Batch function for similarity requests; unknown words get None instead of failing the batch
+        """
+        vec = self.vec
+        vec.get_similarity_index()
+        known = [word for word in dict.fromkeys(words) if word in vec.word_ids]
+        lists = dict(zip(known, vec.get_compound_similarity_lists(known)))
+        return [lists.get(word) for word in words]
+
+    async def search(self, params):
+        return await self.batchers['search'].submit(get_param(params, 'q'))
+
+    async def compounds(self, params):
+        return await self.batchers['compounds'].submit(get_param(params, 'q'))
+
+    async def definitions(self, params):
+        query = get_param(params, 'q')
+        k = int(get_param(params, 'k', 10))
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, self.cdict.search_definitions, query, k)
+        return [[word, score] for word, score in results]
+
+    async def get_similarity_list(self, word):
+        if self.vec is None:
+            raise LookupError('No SinicaVec model loaded; start the server with --sinica')
+        similarity_list = await self.batchers['similarity'].submit(word)
+        if similarity_list is None:
+            raise KeyError(word)
+        return similarity_list
+
+    async def similarity(self, params):
+        n = int(get_param(params, 'n', 10))
+        similarity_list = await self.get_similarity_list(get_param(params, 'word'))
+        return [[word, float(score)] for word, score in similarity_list[:n]]
+
+    async def avg_similarity(self, params):
+        similarity_list = await self.get_similarity_list(get_param(params, 'word'))
+        return sum(float(score) for word, score in similarity_list) / len(similarity_list)
+
+    async def get_stats(self, params):
+        return {'uptime':time.time() - self.started, 'pending':self.pending, 'max_pending':self.max_pending,
+            'rejected':self.rejected, 'endpoints':self.stats.get_stats(),
+            'batches':{name:batcher.get_stats() for name, batcher in self.batchers.items()},
+            'result_caches':{name:owner.result_cache.get_stats() for name, owner in (('cdict', self.cdict), ('vec', self.vec)) \
+                if owner is not None}}
+
+    async def dispatch(self, target):
+        """
+        Returns (status, JSON-serializable body) for a request target such as '/search?q=而*'
+        """
+        url = urlsplit(target)
+        route = self.routes.get(url.path)
+        if route is None:
+            return 404, {'error':'Unknown path {0}'.format(url.path)}
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {'error':'Too many pending requests'}
+        self.pending += 1
+        try:
+            return 200, await route(parse_qs(url.query))
+        except KeyError as error:
+            return 404, {'error':'Not found: {0}'.format(error.args[0])}
+        except LookupError as error:
+            return 404, {'error':str(error)}
+        except ValueError as error:
+            return 400, {'error':str(error)}
+        finally:
+            self.pending -= 1
+
+    async def handle(self, reader, writer):
+        """
+        Serve HTTP/1.1 requests on one connection until the client closes it
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if 'content-length' in headers:
+                    await reader.readexactly(int(headers['content-length']))
+
+                start = time.perf_counter()
+                #clients such as curl send non-ASCII query characters as raw UTF-8, not %-escaped
+                parts = request_line.decode('utf-8', 'replace').split()
+                if len(parts) != 3:
+                    status, body = 400, {'error':'Malformed request line'}
+                elif parts[0] != 'GET':
+                    status, body = 405, {'error':'Only GET is supported'}
+                else:
+                    status, body = await self.dispatch(parts[1])
+                path = urlsplit(parts[1]).path if len(parts) == 3 else ''
+                keep_alive = headers.get('connection', '').lower() != 'close' and request_line.rstrip().endswith(b'1.1')
+                write_response(writer, status, body, keep_alive)
+                await writer.drain()
+                if path in self.routes:
+                    self.stats.record(path, status, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        print('Serving on http://{0}:{1}'.format(host, port), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+#HTTP reason phrases of the statuses the service returns
+REASONS = {200:'OK', 400:'Bad Request', 404:'Not Found', 405:'Method Not Allowed', 503:'Service Unavailable'}
+
+def get_param(params, name, default=None):
+    """
+    Returns the first value of a query string parameter; ValueError if it is missing and has no default
+    """
+    if name in params:
+        return params[name][0]
+    if default is None:
+        raise ValueError('Missing parameter {0}'.format(name))
+    return default
+
+def write_response(writer, status, body, keep_alive):
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    head = ['HTTP/1.1 {0} {1}'.format(status, REASONS[status]), 'Content-Type: application/json; charset=utf-8',
+        'Content-Length: {0}'.format(len(data)), 'Connection: {0}'.format('keep-alive' if keep_alive else 'close')]
+    if status == 503:
+        head.append('Retry-After: 1')
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve CDict and SinicaVec lookups as JSON over HTTP.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--cedict', help='CC-CEDICT dictionary in CSV format')
+    source.add_argument('--snapshot', help='CDict snapshot written by CDict.save_snapshot()')
+    parser.add_argument('--sinica', action='store_true', help='train (or load) SinicaVec on the Sinica Treebank')
+    parser.add_argument('--cache-dir', help='SinicaVec model cache directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4, help='worker threads for lookups')
+    parser.add_argument('--max-pending', type=int, default=1000, help='requests in progress before answering 503')
+    parser.add_argument('--max-batch', type=int, default=64, help='largest micro-batch')
+    parser.add_argument('--batch-delay', type=float, default=2.0,
+        help='milliseconds a request waits for others to batch with')
+    args = parser.parse_args(argv)
+
+    if args.snapshot:
+        cdict = chinese_roots.CDict.load_snapshot(args.snapshot)
+    else:
+        cdict = chinese_roots.CDict(args.cedict)
+    vec = None
+    if args.sinica:
+        vec = chinese_roots.SinicaVec(chinese_roots.sinica, cache_dir=args.cache_dir)
+        vec.get_similarity_index()
+
+    async def serve():
+        service = LookupService(cdict, vec, args.workers, args.max_pending, args.max_batch, args.batch_delay / 1000)
+        await service.serve(args.host, args.port)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -81,7 +81,7 @@ print(most_tags)
 
 #PART 2: working with SinicaVec
 pos_vect = chinese_roots.SinicaVec(sinica)
-print("Number of words detected by Word2Vec vocabulary model: {0}".format(len(pos_vect.model.vocab)))
+print("Number of words detected by Word2Vec vocabulary model: {0}".format(len(pos_vect.model.wv.index_to_key)))
 query = '建造'
 print("Demonstrating with {0}: ".format(query))
 print("Searching for words that contain one or more of {0}:".format([char for char in query]))
@@ -0,0 +1,47 @@
+"""
+Shared fixtures for the chinese_roots tests. Run from the repository root with: python -m pytest tests
+"""
+
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#directory of the small fixed data files the tests use
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+class TinyCorpus:
+    """
+    In-memory stand-in for NLTK's Sinica Treebank reader, with a few hand-written tagged sentences
+    """
+
+    def __init__(self, tagged_sentences):
+        self.tagged_sentences = tagged_sentences
+
+    def tagged_sents(self):
+        return self.tagged_sentences
+
+    def sents(self):
+        return [[word for word, tag in sent] for sent in self.tagged_sentences]
+
+    def tagged_words(self):
+        return [pair for sent in self.tagged_sentences for pair in sent]
+
+    def words(self):
+        return [word for sent in self.tagged_sentences for word, tag in sent]
+
+TINY_SENTS = [
+    [('我們', 'Nh'), ('建造', 'VC'), ('房子', 'Na')],
+    [('他們', 'Nh'), ('建立', 'VC'), ('學校', 'Nc')],
+    [('工人', 'Na'), ('製造', 'VC'), ('機器', 'Na')],
+    [('我們', 'Nh'), ('學習', 'VC'), ('語言', 'Na')],
+    [('學生', 'Na'), ('建造', 'VC'), ('模型', 'Na')],
+    [('他', 'Nh'), ('造成', 'VK'), ('問題', 'Na')],
+    [('老師', 'Na'), ('建議', 'VE'), ('學生', 'Na'), ('學習', 'VC')],
+    [('工廠', 'Nc'), ('製造', 'VC'), ('房子', 'Na'), ('和', 'Caa'), ('機器', 'Na')],
+] * 5
+
+@pytest.fixture
+def tiny_corpus():
+    return TinyCorpus(TINY_SENTS)
@@ -0,0 +1,42 @@
+import pytest
+
+import benchmark
+import chinese_roots
+
+@pytest.fixture(scope='module')
+def cdict(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('flags')
+    benchmark.write_synthetic_cedict(str(tmp_path / 'cedict.u8'), 3000)
+    chinese_roots.CDict.from_txt(str(tmp_path / 'cedict.u8'), str(tmp_path / 'cedict.csv'))
+    return chinese_roots.CDict(str(tmp_path / 'cedict.csv'))
+
+def scan(cdict, words, marker):
+    """
+    The nested scan get_idioms(), get_variants() and get_gugja() used before the flag index
+    """
+    found = []
+    for word in words:
+        is_marked = False
+        for entry in cdict.word_dict[word]:
+            for item in entry:
+                if marker in item:
+                    is_marked = True
+        if is_marked: found.append(word)
+    return found
+
+def test_flags_match_scan(cdict):
+    assert cdict.get_idioms() == scan(cdict, cdict.word_dict.keys(), '(idiom)')
+    assert cdict.get_variants() == scan(cdict, cdict.hanzi, 'variant')
+    assert cdict.get_gugja() == scan(cdict, cdict.hanzi, 'gugja')
+    assert cdict.get_nonrare() == set(cdict.hanzi) - set(scan(cdict, cdict.hanzi, 'variant')) - \
+        set(scan(cdict, cdict.hanzi, 'gugja'))
+    for flag, marker in chinese_roots.FLAG_MARKERS.items():
+        assert cdict.get_by_flag(flag) == scan(cdict, cdict.keys, marker)
+    #the synthetic glosses include each of these, so the comparisons aren't trivially empty
+    assert cdict.get_idioms() and cdict.get_variants() and cdict.get_gugja()
+
+def test_unknown_flag(cdict):
+    with pytest.raises(ValueError):
+        cdict.get_by_flag('idioms')
+    with pytest.raises(ValueError):
+        cdict.get_by_flag('(idiom)')
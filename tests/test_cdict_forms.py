@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import chinese_roots
+from conftest import FIXTURES
+
+@pytest.fixture(scope='module')
+def cdict():
+    return chinese_roots.CDict(os.path.join(FIXTURES, 'cedict_small.csv'))
+
+def heads(entries):
+    return [entry[0] for entry in entries]
+
+def test_header_row_is_skipped(cdict):
+    assert 'trad' not in list(cdict.keys)
+    assert cdict.to_simplified('trade 好') == 'trade 好'
+    assert cdict.to_traditional('simple') == 'simple'
+    assert cdict.lookup_pinyin('pinyin') == []
+    assert cdict.search_definitions('def7') == []
+    assert chinese_roots.Segmenter(cdict).segment('trade') == ['trade']
+
+def test_lookup_simp(cdict):
+    assert heads(cdict.lookup_simp('学习')) == ['學習']
+    assert heads(cdict.lookup_simp('好')) == ['好', '好']
+    #traditional forms that differ from the simplified one are not simplified forms
+    assert cdict.lookup_simp('學習') == []
+
+def test_lookup_pinyin(cdict):
+    assert [entry[2] for entry in cdict.lookup_pinyin('hao3')] == ['hao3']
+    assert heads(cdict.lookup_pinyin('  XUE2   xi2 ')) == ['學習']
+    assert cdict.lookup_pinyin('hao') == []
+    #without tones, every reading of the syllables matches
+    assert [entry[2] for entry in cdict.lookup_pinyin('hao', tones=False)] == ['hao3', 'hao4']
+    assert heads(cdict.lookup_pinyin('xue2 xi1', tones=False)) == ['學習']
+
+def test_search_simp(cdict):
+    assert heads(cdict.search_simp('学*')) == ['學', '學而不厭', '學習']
+    assert heads(cdict.search_simp('*飞')) == ['不翼而飛', '飛', '起飛']
+    assert heads(cdict.search_simp('*而*')) == ['不翼而飛', '學而不厭']
+    assert heads(cdict.search_simp('飞机')) == ['飛機']
+
+def test_search_pinyin(cdict):
+    assert heads(cdict.search_pinyin('fei1 *')) == ['飛機']
+    assert heads(cdict.search_pinyin('* er2')) == ['然而', '因而']
+    assert heads(cdict.search_pinyin('xue *', tones=False)) == ['學而不厭', '學習']
+    #as in search(), '*x*' only matches x strictly inside the form
+    assert heads(cdict.search_pinyin('*er*', tones=False)) == ['不翼而飛', '學而不厭']
+
+def test_converters(cdict):
+    assert cdict.to_simplified('好好學習飛機起飛了') == '好好学习飞机起飞了'
+    assert cdict.to_traditional('好好学习飞机起飞了') == '好好學習飛機起飛了'
+    assert cdict.to_traditional(cdict.to_simplified('學而不厭, 不翼而飛!')) == '學而不厭, 不翼而飛!'
+    assert cdict.to_simplified('') == ''
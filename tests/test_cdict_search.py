@@ -0,0 +1,72 @@
+import csv, os
+
+import pytest
+
+import chinese_roots
+from conftest import FIXTURES
+
+CEDICT_CSV = os.path.join(FIXTURES, 'cedict_small.csv')
+
+QUERIES = ['而', '而*', '*而', '*而*', '', '*', '好', '好*', '*好', '*好*', '飛*', '*飛', '*飛*',
+    '學而*', '*而不*', '龍', '*龍*', '好好學習', '好好學習*']
+
+def load_scan_dict():
+    """
+    Returns {key:[rows]} in load order, as the original CDict built it, without the header row
+    """
+    word_dict = {}
+    with open(CEDICT_CSV, encoding='utf-8') as f:
+        #skip the header row
+        for row in list(csv.reader(f))[1:]:
+            word_dict.setdefault(row[0], []).append(row)
+    return word_dict
+
+def scan_search(word_dict, query):
+    """
+    The original CDict.search(): a scan over every key
+    """
+    if query.startswith('*') and query.endswith('*'):
+        return [word_dict[key] for key in word_dict if query[1:-1] in key \
+            and not key.startswith(query[1:-1]) and not key.endswith(query[1:-1])]
+    elif query.startswith('*'):
+        return [word_dict[key] for key in word_dict if key.endswith(query[1:])]
+    elif query.endswith('*'):
+        return [word_dict[key] for key in word_dict if key.startswith(query[:-1])]
+    return [word_dict[key] for key in word_dict if key.startswith(query)]
+
+@pytest.fixture(scope='module')
+def cdict():
+    return chinese_roots.CDict(CEDICT_CSV)
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_search_matches_scan(cdict, query):
+    expected = scan_search(load_scan_dict(), query)
+    assert [[list(entry) for entry in entries] for entries in cdict.search(query)] == expected
+    assert cdict.get_compounds(query) == [entries[0][0] for entries in expected]
+
+def test_search_examples(cdict):
+    assert cdict.get_compounds('而*') == ['而', '而且', '而已']
+    assert cdict.get_compounds('*而') == ['而', '然而', '因而']
+    assert cdict.get_compounds('*而*') == ['不翼而飛', '學而不厭']
+    assert cdict.get_compounds('*') == []
+    #the header row is not a headword
+    assert cdict.get_compounds('')[0] == '而'
+    assert cdict.search('trad') == []
+    assert len(cdict.get_compounds('')) == len(load_scan_dict())
+    assert [entry[2] for entry in cdict.search('好')[0]] == ['hao3', 'hao4']
+
+def test_search_many_matches_scan(cdict):
+    word_dict = load_scan_dict()
+    #repeats, and queries sharing a prefix, suffix or infix walk
+    queries = QUERIES + ['好*', '好', '*而', '']
+    results = cdict.search_many(queries)
+    assert [[[list(entry) for entry in entries] for entries in result] for result in results] == \
+        [scan_search(word_dict, query) for query in queries]
+    assert cdict.get_compounds_many(queries) == [cdict.get_compounds(query) for query in queries]
+
+def test_cached_results_match(cdict):
+    #the second call is answered from the result cache
+    for query in QUERIES:
+        assert cdict.search(query) == cdict.search(query)
+        assert cdict.get_compounds(query) == cdict.get_compounds(query)
+    assert cdict.result_cache.get_stats()['hits'] > 0
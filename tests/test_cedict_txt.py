@@ -0,0 +1,71 @@
+import csv, gzip, zipfile
+
+import pytest
+
+import chinese_roots
+
+#starts with a byte order mark, which from_txt() skips
+CEDICT_TXT = '''\ufeff# CC-CEDICT
+# Community maintained free Chinese-English dictionary.
+
+而且 而且 [er2 qie3] /(not only ...) but also/moreover/
+不翼而飛 不翼而飞 [bu4 yi4 er2 fei1] /(idiom) to disappear without trace/
+語言學 语言学 [yu3 yan2 xue2] /linguistics/
+this line is not an entry
+好 好 [hao3] /good, well/proper/
+'''
+
+EXPECTED_ROWS = [
+    ['而且', '而且', 'er2 qie3', '(not only ...) but also', 'moreover'],
+    ['不翼而飛', '不翼而飞', 'bu4 yi4 er2 fei1', '(idiom) to disappear without trace'],
+    ['語言學', '语言学', 'yu3 yan2 xue2', 'linguistics'],
+    ['好', '好', 'hao3', 'good, well', 'proper'],
+]
+
+EXPECTED_COUNTS = {'entries':4, 'comments':3, 'malformed':1}
+
+def write_plain(path):
+    path.write_text(CEDICT_TXT, encoding='utf-8')
+
+def write_gzip(path):
+    with gzip.open(str(path), 'wt', encoding='utf-8') as f:
+        f.write(CEDICT_TXT)
+
+def write_zip(path):
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        archive.writestr('README.md', 'not the dictionary')
+        archive.writestr('cedict_ts.u8', CEDICT_TXT.encode('utf-8'))
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+@pytest.mark.parametrize('write, name', [(write_plain, 'cedict.u8'), (write_gzip, 'cedict.u8.gz'),
+    (write_zip, 'cedict.zip')])
+def test_from_txt(tmp_path, write, name):
+    source = tmp_path / name
+    write(source)
+    dest = str(tmp_path / 'cedict.csv')
+    assert chinese_roots.CDict.from_txt(str(source), dest) == EXPECTED_COUNTS
+    rows = read_rows(dest)
+    assert rows[0][:4] == ['trad', 'simp', 'pinyin', 'def1']
+    assert rows[1:] == EXPECTED_ROWS
+
+def test_comma_in_definition_is_one_column(tmp_path):
+    source = tmp_path / 'cedict.u8'
+    write_plain(source)
+    dest = str(tmp_path / 'cedict.csv')
+    chinese_roots.CDict.from_txt(str(source), dest)
+    with open(dest, encoding='utf-8') as f:
+        assert '好,好,hao3,"good, well",proper' in f.read().splitlines()
+    cdict = chinese_roots.CDict(dest)
+    assert cdict.word_dict['好'] == [['好', '好', 'hao3', 'good, well', 'proper']]
+    assert [word for word, score in cdict.search_definitions('well')] == ['好']
+
+def test_zip_without_dictionary(tmp_path):
+    source = tmp_path / 'cedict.zip'
+    with zipfile.ZipFile(str(source), 'w') as archive:
+        archive.writestr('a.md', 'one')
+        archive.writestr('b.md', 'two')
+    with pytest.raises(ValueError):
+        chinese_roots.CDict.from_txt(str(source), str(tmp_path / 'cedict.csv'))
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+import benchmark
+import chinese_roots
+
+CEDICT = """# CC-CEDICT
+建 建 [jian4] /to build/to establish/
+建造 建造 [jian4 zao4] /to build/to construct/
+房子 房子 [fang2 zi5] /house/building/CL:所[suo3]/
+學 学 [xue2] /to study/to learn/school/
+好 好 [hao3] /good/well/
+好 好 [hao4] /to be fond of/
+建築 建筑 [jian4 zhu4] /building/to build a house/
+"""
+
+@pytest.fixture
+def cdict(tmp_path):
+    (tmp_path / 'cedict.u8').write_text(CEDICT, encoding='utf-8')
+    chinese_roots.CDict.from_txt(str(tmp_path / 'cedict.u8'), str(tmp_path / 'cedict.csv'))
+    return chinese_roots.CDict(str(tmp_path / 'cedict.csv'))
+
+@pytest.fixture(scope='module')
+def synthetic_index(tmp_path_factory):
+    path = tmp_path_factory.mktemp('cedict')
+    benchmark.write_synthetic_cedict(str(path / 'cedict.u8'), 3000, seed=1)
+    chinese_roots.CDict.from_txt(str(path / 'cedict.u8'), str(path / 'cedict.csv'))
+    return chinese_roots.CDict(str(path / 'cedict.csv')).get_definition_index()
+
+def words(results):
+    return [word for word, score in results]
+
+def test_search_definitions(cdict):
+    assert set(words(cdict.search_definitions('build', None))) == {'建', '建造', '建築'}
+    #shorter definitions score higher, and ties go to the earlier entry
+    assert words(cdict.search_definitions('to build', None)) == ['建', '建造', '建築']
+    assert words(cdict.search_definitions('to build', 1)) == ['建']
+    assert words(cdict.search_definitions('house OR learn', None)) == ['學', '房子', '建築']
+    assert cdict.search_definitions('zzz') == []
+    assert cdict.search_definitions('build zzz') == []
+    #a word with two entries is listed once
+    assert words(cdict.search_definitions('good OR fond', None)) == ['好']
+
+def test_phrases(cdict):
+    assert set(words(cdict.search_definitions('"to build"', None))) == {'建', '建造', '建築'}
+    assert words(cdict.search_definitions('"build a house"', None)) == ['建築']
+    assert cdict.search_definitions('"house to"') == []
+    #a phrase doesn't run from one definition into the next
+    assert cdict.search_definitions('"build to"') == []
+    assert cdict.search_definitions('"establish to"') == []
+
+def test_has_phrase_matches_tokenized_fields(synthetic_index):
+    index = synthetic_index
+    for phrase in (['to', 'build'], ['variant', 'of'], ['house', 'to'], ['cl', '個']):
+        for row in range(0, len(index.row_keys), 7):
+            fields = [chinese_roots.tokenize_definition(field) for field in index.word_dict.get_row(row)[index.first_field:]]
+            expected = any(tokens[n:n + len(phrase)] == phrase for tokens in fields for n in range(len(tokens)))
+            assert index.has_phrase(row, phrase) == expected
+
+def test_top_k_matches_full_ranking(synthetic_index):
+    rng = random.Random(0)
+    vocabulary = ['to', 'build', 'house', 'study', 'of', 'variant', 'surname', 'li', 'water', 'old', 'cl', 'good', 'zzz']
+    for n in range(200):
+        clauses = []
+        for m in range(rng.choice((1, 1, 1, 2))):
+            clause = rng.sample(vocabulary, rng.randint(1, 3))
+            clauses.append('"{0}"'.format(' '.join(clause)) if rng.random() < 0.3 else ' '.join(clause))
+        query = ' OR '.join(clauses)
+        ranking = synthetic_index.search(query, None)
+        for k in (1, 5, 20):
+            assert synthetic_index.search(query, k) == ranking[:k], query
+
+def test_score_matches_full_walk(synthetic_index):
+    index = synthetic_index
+    rows = index.match_clause([['to'], ['build']])
+    scores = index.score(rows, ['to', 'build'])
+    for row in rows[:50]:
+        found = index.find_postings(row, ['to', 'build'])
+        assert scores[row] == index.get_impact(index.term_ids['to'], found['to']) + \
+            index.get_impact(index.term_ids['build'], found['build'])
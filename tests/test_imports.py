@@ -0,0 +1,28 @@
+import json, os, subprocess, sys
+
+from conftest import FIXTURES
+
+#CDict only needs the standard library; these are imported when SinicaVec or the corpus are used
+HEAVY_MODULES = ['numpy', 'gensim', 'nltk']
+
+SCRIPT = '''
+import json, sys
+import chinese_roots
+cdict = chinese_roots.CDict(sys.argv[1])
+cdict.search('而*')
+cdict.search_many(['*飛', '*而*'])
+cdict.get_idioms()
+cdict.search_definitions('fly')
+cdict.lookup_pinyin('hao', tones=False)
+cdict.to_simplified('好好學習')
+cdict.get_segmenter().segment('好好學習')
+cdict.save_snapshot(sys.argv[2])
+chinese_roots.CDict.load_snapshot(sys.argv[2]).search('*而')
+print(json.dumps([name for name in {0} if name in sys.modules]))
+'''.format(HEAVY_MODULES)
+
+def test_cdict_does_not_import_heavy_modules(tmp_path):
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', SCRIPT, os.path.join(FIXTURES, 'cedict_small.csv'),
+        str(tmp_path / 'cedict.snap')], cwd=package_dir, check=True, stdout=subprocess.PIPE).stdout
+    assert json.loads(output) == []
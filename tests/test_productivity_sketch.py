@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+from chinese_roots import HyperLogLog, ProductivitySketch
+
+def make_words(n, seed=0):
+    rng = random.Random(seed)
+    chars = [chr(0x4e00 + n) for n in range(200)]
+    return [''.join(rng.choices(chars, k=rng.randint(1, 3))) for m in range(n)]
+
+def add_all(hll, items):
+    for item in items:
+        hll.add_hash(ProductivitySketch.hash_word(item))
+    return hll
+
+@pytest.mark.parametrize('n', [10, 100, 1000, 20000])
+def test_hyperloglog_error(n):
+    hll = add_all(HyperLogLog(12), ('word{0}'.format(m) for m in range(n)))
+    #well within three standard errors
+    assert abs(hll.estimate() - n) <= 3 * hll.get_error() * n + 1
+
+def test_hyperloglog_repeats():
+    hll = add_all(HyperLogLog(), ['同'] * 1000)
+    assert round(hll.estimate()) == 1
+
+def test_hyperloglog_merge():
+    left = add_all(HyperLogLog(), ('word{0}'.format(m) for m in range(3000)))
+    right = add_all(HyperLogLog(), ('word{0}'.format(m) for m in range(2000, 6000)))
+    both = add_all(HyperLogLog(), ('word{0}'.format(m) for m in range(6000)))
+    left.merge(right)
+    assert left.get_registers() == both.get_registers()
+    assert left.estimate() == pytest.approx(both.estimate())
+
+def test_hyperloglog_sparse_to_dense():
+    hll = HyperLogLog(8)
+    add_all(hll, ('word{0}'.format(m) for m in range(5)))
+    assert type(hll.registers) is dict
+    add_all(hll, ('word{0}'.format(m) for m in range(5, 500)))
+    assert type(hll.registers) is bytearray
+    assert hll.zeros == hll.get_registers().count(0)
+
+def test_precision_bounds():
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+    with pytest.raises(ValueError):
+        HyperLogLog(17)
+
+def test_sketch_matches_exact_counts():
+    words = make_words(30000)
+    sketch = ProductivitySketch(precision=12)
+    sketch.add_words(words)
+    assert sketch.token_count == len(words)
+
+    types = {}
+    tokens = {}
+    for word in words:
+        for char in set(word):
+            types.setdefault(char, set()).add(word)
+            tokens[char] = tokens.get(char, 0) + 1
+    for char in types:
+        estimate, error = sketch.get_estimate(char)
+        #the bound is two standard errors; allow a little more so the test isn't flaky
+        assert abs(estimate - len(types[char])) <= 1.5 * error + 1
+        assert sketch.get_estimate(char, by='tokens') == (tokens[char], 0)
+    assert sketch.get_productivity_list(by='tokens')[0] == max(tokens.items(), key=lambda x:x[1])
+
+def test_sketch_merge_equivalence():
+    words = make_words(10000)
+    whole = ProductivitySketch()
+    whole.add_words(words)
+    shards = [ProductivitySketch() for n in range(3)]
+    for n, shard in enumerate(shards):
+        shard.add_words(words[n::3])
+    merged = ProductivitySketch()
+    for shard in shards:
+        merged.merge(shard)
+    assert merged.token_count == whole.token_count
+    assert dict(merged.token_counts) == dict(whole.token_counts)
+    #the same registers as one sketch of everything; estimates only differ by rounding
+    assert {char:sketch.get_registers() for char, sketch in merged.type_sketches.items()} == \
+        {char:sketch.get_registers() for char, sketch in whole.type_sketches.items()}
+    for char in whole.token_counts:
+        assert merged.get_estimate(char)[0] == pytest.approx(whole.get_estimate(char)[0])
+    with pytest.raises(ValueError):
+        merged.merge(ProductivitySketch(precision=8))
+
+def test_sketch_save_load(tmp_path):
+    sketch = ProductivitySketch()
+    sketch.add_tagged_sents([[('研究', 'VE'), ('生命', 'Na')], [('研究生', 'Na')]])
+    sketch.add_sents([['生命', '起源']])
+    path = str(tmp_path / 'sketch.json')
+    sketch.save(path)
+    loaded = ProductivitySketch.load(path)
+    assert loaded.precision == sketch.precision
+    assert loaded.token_count == sketch.token_count == 5
+    assert dict(loaded.token_counts) == dict(sketch.token_counts)
+    assert loaded.get_top() == sketch.get_top()
+    assert loaded.get_productivity_list() == sketch.get_productivity_list()
+    assert loaded.get_estimate('生')[0] == pytest.approx(2, abs=0.1)
+    #loaded sketches keep counting and merging like the original
+    loaded.add_words(['生日'])
+    sketch.add_words(['生日'])
+    assert loaded.get_top() == sketch.get_top()
+
+def test_word_hash_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(ProductivitySketch, 'hash_cache_size', 100)
+    sketch = ProductivitySketch()
+    sketch.add_words('word{0}'.format(n) for n in range(1000))
+    assert len(sketch.word_hashes) <= 100
+    assert sketch.get_estimate('w')[0] == pytest.approx(1000, rel=0.1)
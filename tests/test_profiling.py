@@ -0,0 +1,100 @@
+import json, os, sys
+
+import pytest
+
+import chinese_roots
+from conftest import FIXTURES
+
+CSV_PATH = os.path.join(FIXTURES, 'cedict_small.csv')
+
+@pytest.fixture
+def profiling():
+    recorder = chinese_roots.enable_profiling()
+    yield recorder
+    chinese_roots.disable_profiling()
+
+def get_attributes():
+    """
+    Returns the raw attributes profiling replaces, of format {(class name, attribute):object}
+    """
+    return {(class_name, attribute):chinese_roots.__dict__[attribute] if class_name is None else \
+        getattr(chinese_roots, class_name).__dict__[attribute] for class_name, attribute, items, counter in \
+        chinese_roots.PROFILED}
+
+def test_disable_restores_originals():
+    originals = get_attributes()
+    recorder = chinese_roots.enable_profiling()
+    patched = get_attributes()
+    assert all(patched[name] is not original for name, original in originals.items())
+    assert isinstance(patched[('CDict', 'load_snapshot')], classmethod)
+    assert isinstance(patched[('CDict', 'from_txt')], staticmethod) == \
+        isinstance(originals[('CDict', 'from_txt')], staticmethod)
+    #enabling again keeps the same recorder and doesn't wrap the wrappers
+    assert chinese_roots.enable_profiling() is recorder
+    assert get_attributes() == patched
+
+    assert chinese_roots.disable_profiling() is recorder
+    assert all(restored is originals[name] for name, restored in get_attributes().items())
+    assert chinese_roots.profiler is None and chinese_roots.profiled_originals == {}
+    assert chinese_roots.disable_profiling() is None
+
+def test_calls_and_cache_counters(profiling):
+    cdict = chinese_roots.CDict(CSV_PATH)
+    cdict.search('而*')
+    cdict.search('而*')
+    cdict.search('*飛')
+    stats = profiling.get_stats()
+    methods = stats['methods']
+    assert methods['CDict.__init__']['calls'] == 1
+    assert methods['CDict.__init__']['items'] == len(cdict.keys)
+    #the module-level function is recorded through the global name CDict uses
+    assert methods['build_search_tries']['calls'] == 1
+    #search() goes through search_many(), which asks the result cache first
+    assert methods['CDict.search_many']['calls'] == 3
+    assert stats['counters'] == {'ResultCache.hits':1, 'ResultCache.misses':2}
+    for method in methods.values():
+        assert method['mean'] == pytest.approx(method['seconds'] / method['calls'])
+
+def test_trace_events(profiling):
+    chinese_roots.CDict(CSV_PATH).search_definitions('fly')
+    trace = profiling.get_trace()
+    events = trace['traceEvents']
+    assert {event['name'] for event in events} >= {'CDict.__init__', 'DefinitionIndex.__init__',
+        'CDict.search_definitions'}
+    for event in events:
+        assert event['ph'] == 'X'
+        assert event['pid'] == os.getpid()
+        assert event['ts'] >= 0 and event['dur'] >= 0
+        assert event['cat'] == event['name'].split('.')[0]
+    init = next(event for event in events if event['name'] == 'CDict.__init__')
+    tries = next(event for event in events if event['name'] == 'build_search_tries')
+    #nested calls lie inside their caller
+    assert init['ts'] <= tries['ts'] and tries['ts'] + tries['dur'] <= init['ts'] + init['dur']
+    assert json.loads(json.dumps(trace)) == trace
+
+def test_max_events():
+    recorder = chinese_roots.Profiler(max_events=2)
+    for n in range(5):
+        recorder.record('f', n, n + 1)
+    assert len(recorder.get_trace()['traceEvents']) == 2
+    assert recorder.get_stats()['dropped_events'] == 3
+    assert recorder.get_stats()['methods']['f']['calls'] == 5
+
+def test_main_writes_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', list(sys.argv))
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    script = tmp_path / 'script.py'
+    script.write_text('import sys\nimport chinese_roots\n'
+        'chinese_roots.CDict(sys.argv[1]).search_many(["而*", "好*"])\n', encoding='utf-8')
+    stats_path = str(tmp_path / 'stats.json')
+    trace_path = str(tmp_path / 'trace.json')
+    assert chinese_roots.main(['--profile', stats_path, '--trace', trace_path, str(script), CSV_PATH]) == 0
+    with open(stats_path) as f:
+        stats = json.load(f)
+    assert stats['methods']['CDict.search_many']['calls'] == 1
+    assert stats['methods']['CDict.search_many']['items'] == len(chinese_roots.CDict(CSV_PATH).search('而*')) + \
+        len(chinese_roots.CDict(CSV_PATH).search('好*'))
+    with open(trace_path) as f:
+        assert any(event['name'] == 'CDict.__init__' for event in json.load(f)['traceEvents'])
+    #profiling is off again once the script has finished
+    assert chinese_roots.profiler is None
@@ -0,0 +1,121 @@
+import threading
+
+import chinese_roots
+from chinese_roots import ResultCache
+
+MODEL = object()
+TOKEN = (MODEL,)
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru_eviction_order():
+    cache = ResultCache(capacity=2)
+    cache.put('a', TOKEN, 1)
+    cache.put('b', TOKEN, 2)
+    #reading 'a' makes 'b' the least recently used
+    assert cache.get('a', TOKEN) == 1
+    cache.put('c', TOKEN, 3)
+    assert list(cache.results) == ['a', 'c']
+    assert cache.get('b', TOKEN) is None
+    assert cache.get_stats()['evictions'] == 1
+
+def test_capacity_zero_disables_caching():
+    cache = ResultCache(capacity=0)
+    cache.put('a', TOKEN, 1)
+    assert cache.get('a', TOKEN, 'none') == 'none'
+    assert cache.get_stats()['size'] == 0
+
+def test_ttl_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(chinese_roots.time, 'monotonic', clock)
+    cache = ResultCache(ttl=10)
+    cache.put('a', TOKEN, 1)
+    clock.now += 9.5
+    assert cache.get('a', TOKEN) == 1
+    clock.now += 1
+    assert cache.get('a', TOKEN) is None
+    assert cache.get_stats()['expirations'] == 1
+    assert cache.get_stats()['size'] == 0
+
+def test_token_invalidation():
+    cache = ResultCache()
+    cache.put('a', TOKEN, 1)
+    cache.put('b', TOKEN, 2)
+    #tokens are compared by identity, so an equal but different object is new data
+    new_token = (object(),)
+    assert cache.get('a', new_token) is None
+    assert cache.get_stats()['invalidations'] == 2
+    assert cache.get_stats()['size'] == 0
+    #a result computed from the old data is not stored any more
+    cache.put('a', TOKEN, 1)
+    assert cache.get('a', new_token) is None
+    cache.put('a', new_token, 3)
+    assert cache.get('a', new_token) == 3
+    assert cache.get('a', (object(), object())) is None
+
+def test_retoken():
+    cache = ResultCache()
+    cache.put('a', TOKEN, 1)
+    copy_token = (object(),)
+    assert cache.retoken(TOKEN, copy_token)
+    assert cache.get('a', copy_token) == 1
+    #results from other data are not carried over
+    assert not cache.retoken(TOKEN, (object(),))
+    assert cache.get('a', copy_token) == 1
+
+def test_discard_if():
+    cache = ResultCache()
+    for word in ['建造', '建立', '語言']:
+        cache.put(('similarity_list', word), TOKEN, word)
+    assert cache.discard_if(lambda key: '建' in key[1]) == 2
+    assert list(cache.results) == [('similarity_list', '語言')]
+    assert cache.get(('similarity_list', '語言'), TOKEN) == '語言'
+    assert cache.get_stats()['invalidations'] == 2
+
+def test_counters():
+    cache = ResultCache(capacity=1)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute('a', TOKEN, compute) == 1
+    assert cache.get_or_compute('a', TOKEN, compute) == 1
+    assert cache.get_or_compute('b', TOKEN, compute) == 2
+    #None is a result like any other, not a miss
+    cache.put('c', TOKEN, None)
+    assert cache.get('c', TOKEN, 'none') is None
+    assert len(calls) == 2
+    assert cache.get_stats() == {'hits':2, 'misses':2, 'evictions':2, 'expirations':0, 'invalidations':0,
+        'size':1, 'capacity':1}
+    cache.clear()
+    assert cache.get_stats()['size'] == 0
+
+def test_concurrent_get_or_compute():
+    cache = ResultCache(capacity=50)
+    keys = list(range(20))
+    n_threads, rounds = 8, 50
+    barrier = threading.Barrier(n_threads)
+    errors = []
+
+    def worker():
+        barrier.wait()
+        for n in range(rounds):
+            for key in keys:
+                if cache.get_or_compute(key, TOKEN, lambda: key * key) != key * key:
+                    errors.append(key)
+
+    threads = [threading.Thread(target=worker) for n in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.get_stats()
+    assert errors == []
+    assert stats['hits'] + stats['misses'] == n_threads * rounds * len(keys)
+    #each key is computed at most once per thread, however the threads interleave
+    assert len(keys) <= stats['misses'] <= n_threads * len(keys)
+    assert stats['size'] == len(keys)
+    assert dict((key, value[1]) for key, value in cache.results.items()) == {key:key * key for key in keys}
@@ -0,0 +1,61 @@
+import pytest
+
+import chinese_roots
+
+CEDICT = """# CC-CEDICT
+研究 研究 [yan2 jiu1] /research/to study/
+研究生 研究生 [yan2 jiu1 sheng1] /graduate student/
+生命 生命 [sheng1 ming4] /life/
+命 命 [ming4] /life/fate/
+的 的 [de5] /of/
+起源 起源 [qi3 yuan2] /origin/
+結婚 结婚 [jie2 hun1] /to marry/
+和 和 [he2] /and/
+和尚 和尚 [he2 shang5] /Buddhist monk/
+尚未 尚未 [shang4 wei4] /not yet/
+未 未 [wei4] /not yet/
+"""
+
+@pytest.fixture(scope='module')
+def cdict(tmp_path_factory):
+    path = tmp_path_factory.mktemp('cedict')
+    (path / 'cedict.u8').write_text(CEDICT, encoding='utf-8')
+    chinese_roots.CDict.from_txt(str(path / 'cedict.u8'), str(path / 'cedict.csv'))
+    return chinese_roots.CDict(str(path / 'cedict.csv'))
+
+@pytest.mark.parametrize('mode, text, expected', [
+    ('forward', '研究生命的起源', ['研究生', '命', '的', '起源']),
+    ('backward', '研究生命的起源', ['研究', '生命', '的', '起源']),
+    ('forward', '結婚的和尚未結婚的', ['結婚', '的', '和尚', '未', '結婚', '的']),
+    ('backward', '結婚的和尚未結婚的', ['結婚', '的', '和', '尚未', '結婚', '的']),
+    #with no counts every word is as likely, so the fewest words win, and ties go to the longer first word
+    ('dag', '研究生命的起源', ['研究生', '命', '的', '起源']),
+    ('dag', '結婚的和尚未結婚的', ['結婚', '的', '和尚', '未', '結婚', '的']),
+])
+def test_modes(cdict, mode, text, expected):
+    assert chinese_roots.Segmenter(cdict, mode).segment(text) == expected
+
+def test_dag_uses_counts(cdict):
+    freqs = {'研究':50, '生命':50, '研究生':1, '命':1, '的':100, '起源':10, '結婚':20, '和':80, '和尚':1, '尚未':30, '未':1}
+    segmenter = chinese_roots.Segmenter(cdict, 'dag', freqs)
+    assert segmenter.segment('研究生命的起源') == ['研究', '生命', '的', '起源']
+    assert segmenter.segment('結婚的和尚未結婚的') == ['結婚', '的', '和', '尚未', '結婚', '的']
+
+@pytest.mark.parametrize('mode', ['forward', 'backward', 'dag'])
+def test_fallback(cdict, mode):
+    segmenter = chinese_roots.Segmenter(cdict, mode)
+    #ASCII letters and digits stay together, other unknown chars are split one by one
+    assert segmenter.segment('GPT4研究') == ['GPT4', '研究']
+    assert segmenter.segment('研究abc的') == ['研究', 'abc', '的']
+    assert segmenter.segment('電腦') == ['電', '腦']
+    #whitespace separates words and is dropped
+    assert segmenter.segment(' 起源  v2 \n的') == ['起源', 'v2', '的']
+    assert segmenter.segment('') == []
+
+def test_get_matches(cdict):
+    matches = chinese_roots.Segmenter(cdict).get_matches('研究生命')
+    assert [sorted(ends) for ends in matches] == [[2, 3], [], [4], [4]]
+
+def test_unknown_mode(cdict):
+    with pytest.raises(ValueError):
+        chinese_roots.Segmenter(cdict, 'longest')
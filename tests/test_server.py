@@ -0,0 +1,129 @@
+import asyncio, json, os, threading
+
+import pytest
+
+import chinese_roots
+import server
+from conftest import FIXTURES
+
+@pytest.fixture
+def cdict():
+    return chinese_roots.CDict(os.path.join(FIXTURES, 'cedict_small.csv'), result_cache_size=0)
+
+async def get(port, target):
+    """
+    Returns (status, headers, body) of one GET request to the service on localhost
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('GET {0} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.format(target).encode('utf-8'))
+    await writer.drain()
+    head, _, body = (await reader.read()).partition(b'\r\n\r\n')
+    writer.close()
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, json.loads(body.decode('utf-8'))
+
+async def serving(service, requests):
+    """
+    Start service on a free localhost port, run requests(port) against it and return its result
+    """
+    listener = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+    try:
+        return await requests(listener.sockets[0].getsockname()[1])
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+def test_percentiles():
+    values = [n / 1000 for n in range(1, 11)]
+    assert server.LatencyStats.get_percentiles(values) == {'p50':pytest.approx(5), 'p90':pytest.approx(9),
+        'p99':pytest.approx(10)}
+    assert server.LatencyStats.get_percentiles([0.002]) == {'p50':2, 'p90':2, 'p99':2}
+    assert server.LatencyStats.get_percentiles([]) == {}
+
+def test_concurrent_requests_share_one_batch(cdict, monkeypatch):
+    batches = []
+    search_many = cdict.search_many
+    monkeypatch.setattr(cdict, 'search_many', lambda queries: batches.append(list(queries)) or search_many(queries))
+    service = server.LookupService(cdict, workers=1, max_delay=0.05)
+    queries = ['而*', '*飛', '*好*', '學*', '而*']
+
+    async def requests():
+        return await asyncio.gather(*(service.dispatch('/search?q=' + query) for query in queries))
+
+    responses = asyncio.run(requests())
+    assert batches == [queries]
+    for query, (status, body) in zip(queries, responses):
+        assert status == 200
+        assert body == cdict.search(query)
+
+def test_too_many_pending_requests(cdict, monkeypatch):
+    release = threading.Event()
+    search_many = cdict.search_many
+
+    def blocked(queries):
+        release.wait(5)
+        return search_many(queries)
+
+    monkeypatch.setattr(cdict, 'search_many', blocked)
+    service = server.LookupService(cdict, workers=1, max_pending=1, max_delay=0)
+
+    async def requests(port):
+        first = asyncio.ensure_future(service.dispatch('/search?q=而*'))
+        while service.pending < 1:
+            await asyncio.sleep(0.001)
+        rejected = await get(port, '/search?q=好*')
+        release.set()
+        return rejected, await first
+
+    (status, headers, body), first = asyncio.run(serving(service, requests))
+    assert status == 503
+    assert headers['Retry-After'] == '1'
+    assert 'error' in body
+    assert first == (200, cdict.search('而*'))
+    assert service.rejected == 1
+    assert service.pending == 0
+
+def test_not_found(cdict, tiny_corpus):
+    vec = chinese_roots.SinicaVec(tiny_corpus, seed=1, workers=1, vector_size=16)
+    service = server.LookupService(cdict, vec, workers=1, max_delay=0)
+
+    async def requests(port):
+        return [await get(port, target) for target in ('/similarity?word=飛機', '/similarity?word=建造&n=2',
+            '/similarity?word=%E5%BB%BA%E9%80%A0&n=2', '/nowhere', '/search')]
+
+    (unknown, known, escaped, path, missing) = asyncio.run(serving(service, requests))
+    assert unknown[0] == 404
+    assert '飛機' in unknown[2]['error']
+    assert known[0] == 200
+    assert [word for word, score in known[2]] == [word for word, score in vec.get_compound_similarity_list('建造')[:2]]
+    assert escaped[2] == known[2]
+    assert path[0] == 404
+    assert missing[0] == 400
+
+    #without a model, the similarity endpoints are not found either
+    status, body = asyncio.run(server.LookupService(cdict, workers=1).dispatch('/avg_similarity?word=建造'))
+    assert status == 404
+
+def test_stats():
+    service = server.LookupService(chinese_roots.CDict(os.path.join(FIXTURES, 'cedict_small.csv')), workers=1,
+        max_delay=0)
+
+    async def requests(port):
+        for target in ('/search?q=而*', '/search?q=而*', '/compounds?q=*飛', '/definitions?q=fly', '/nowhere'):
+            await get(port, target)
+        return await get(port, '/stats')
+
+    status, headers, stats = asyncio.run(serving(service, requests))
+    assert status == 200
+    endpoints = stats['endpoints']
+    assert endpoints['/search']['count'] == 2
+    assert endpoints['/search']['status'] == {'200':2}
+    assert set(endpoints['/search']) >= {'p50', 'p90', 'p99', 'max'}
+    assert endpoints['/compounds']['count'] == endpoints['/definitions']['count'] == 1
+    assert '/nowhere' not in endpoints
+    assert stats['batches']['search']['batches'] == 2
+    assert stats['result_caches']['cdict']['hits'] == 1
+    assert 'vec' not in stats['result_caches']
+    #the /stats request itself is in progress
+    assert stats['pending'] == 1 and stats['rejected'] == 0
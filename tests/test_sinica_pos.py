@@ -0,0 +1,131 @@
+from array import array
+
+from chinese_roots import CompoundIndex, SinicaPOS, read_tagged_sents
+from conftest import TINY_SENTS, TinyCorpus
+
+WORDS = ['我們', '建造', '房子', '建立', '學校', '學生', '造成', '他', '建造']
+
+def csr_lists(index):
+    offsets, postings = index.offsets, index.postings
+    return [list(postings[offsets[root_id]:offsets[root_id + 1]]) for root_id in range(len(index.roots))]
+
+def test_compound_index_matches_scan():
+    index = CompoundIndex(WORDS)
+    words = list(dict.fromkeys(WORDS))
+    assert index.words == words
+    for char in '我們建造房子立學校生成他':
+        assert index[char] == [word for word in words if char in word]
+        assert index.get_count(char) == len(index[char])
+    assert index['好'] == []
+    assert index.get('好') is None
+
+def test_extend_matches_bulk_build():
+    bulk = CompoundIndex(WORDS)
+    incremental = CompoundIndex([])
+    changed = set()
+    for word in WORDS:
+        changed.update(incremental.roots[root_id] for root_id in incremental.extend([word]))
+    assert changed == set(bulk.roots)
+    #reads before merging see the tail lists
+    assert {char:incremental[char] for char in incremental} == {char:bulk[char] for char in bulk}
+    assert incremental.get_productivity_list() == bulk.get_productivity_list()
+    #reading the arrays merges the tails into them
+    assert csr_lists(incremental) == csr_lists(bulk)
+    assert incremental.word_roots == bulk.word_roots
+    assert incremental.word_root_offsets == bulk.word_root_offsets
+    assert incremental.tail_postings == {}
+
+def test_extend_keeps_old_arrays():
+    index = CompoundIndex(['建造', '建立'])
+    postings = index.postings
+    assert index.extend(['建立', '學校']) == [index.root_ids['學'], index.root_ids['校']]
+    assert index.postings is not postings
+    assert postings == array('i', [0, 1, 0, 1])
+
+def test_extend_does_not_rebuild_arrays():
+    words = ['{0}{1}'.format(chr(0x4e00 + i // 100), chr(0x4e00 + i % 100)) for i in range(2000)]
+    index = CompoundIndex(words)
+    postings = index.csr_postings
+    offsets = index.csr_offsets
+    count = index.get_count('一')
+    for i in range(50):
+        index.extend(['一新{0}'.format(i)])
+        assert index.get_count('一') == count + i + 1
+        assert index.get_count('新') == i + 1
+    assert index.get('新')[-1] == '一新49'
+    assert dict(index.get_productivity_list())['新'] == 50
+    #counts and lookups read the tails; the arrays are only rebuilt once they are read
+    assert index.csr_postings is postings
+    assert index.csr_offsets is offsets
+    assert len(index.tail_word_roots) == 50
+    assert index.postings is not postings
+    assert index.tail_postings == {} and index.tail_word_roots == []
+    assert index.get_count('新') == 50
+
+def test_add_tagged_sents(tiny_corpus):
+    pos = SinicaPOS(tiny_corpus)
+    productivity = dict(pos.get_productivity_list())
+    pos.add_tagged_sents([[('建築', 'VC'), ('學校', 'Nc')], [('學校', 'Nc')]])
+    assert pos.get_wordtag_dict()['建築'] == ['VC']
+    assert pos.get_wordtag_dict()['學校'] == ['Nc']
+    assert '建築' in pos.get_words_by_tag('VC')
+    assert pos.get_compound_dict()['建'][-1] == '建築'
+    assert dict(pos.get_productivity_list())['建'] == productivity['建'] + 1
+    assert '築' in pos.get_hanzi()
+
+def test_looked_up_word_is_still_indexed():
+    pos = SinicaPOS()
+    pos.get_wordtag_dict().get('新詞')
+    pos.wordtag_dict['新詞']
+    pos.add_tagged_sents([[('新詞', 'N')]])
+    assert pos.get_compound_dict()['新'] == ['新詞']
+    assert ('新', 1) in pos.get_productivity_list()
+
+def test_getters_return_copies(tiny_corpus):
+    pos = SinicaPOS(tiny_corpus)
+    pos.get_wordtag_dict()['新詞'] = ['N']
+    pos.get_tagword_dict()['VC'].append('新詞')
+    pos.get_words_by_tag('VC').append('新詞')
+    assert '新詞' not in pos.get_wordtag_dict()
+    assert '新詞' not in pos.get_words_by_tag('VC')
+    assert pos.get_words_by_tag('XX') == []
+
+TAGGED_LINES = ['{0}\n'.format(' '.join('{0}/{1}'.format(word, tag) for word, tag in sent)) for sent in TINY_SENTS[:8]]
+
+def write_shards(tmp_path, lines, n_shards):
+    paths = []
+    for n in range(n_shards):
+        path = tmp_path / 'shard{0}.txt'.format(n)
+        path.write_text(''.join(lines[n::n_shards]), encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+def get_indexes(pos):
+    compound_dict = pos.get_compound_dict()
+    return (pos.get_wordtag_dict(), pos.get_tagword_dict(), compound_dict.words, compound_dict.roots,
+        compound_dict.postings, compound_dict.offsets, compound_dict.word_roots, pos.get_productivity_list(),
+        pos.get_hanzi())
+
+def test_read_tagged_sents(tmp_path):
+    path = tmp_path / 'tagged.txt'
+    path.write_text('我/Nh 喜歡/VK  你/Nh\n\n1/2/Neu 新詞\n', encoding='utf-8')
+    assert list(read_tagged_sents(str(path))) == [[('我', 'Nh'), ('喜歡', 'VK'), ('你', 'Nh')],
+        [('1/2', 'Neu'), ('新詞', None)]]
+    path.write_text('我|Nh 你|Nh\n', encoding='big5')
+    assert list(read_tagged_sents(str(path), sep='|', encoding='big5')) == [[('我', 'Nh'), ('你', 'Nh')]]
+
+def test_ingestion_paths_agree(tmp_path):
+    paths = write_shards(tmp_path, TAGGED_LINES * 3, 3)
+    sequential = SinicaPOS.from_files(paths)
+    sharded = SinicaPOS.from_files(paths, workers=2)
+    streamed = SinicaPOS()
+    for path in paths:
+        streamed.add_tagged_sents(read_tagged_sents(path))
+    assert get_indexes(sharded) == get_indexes(sequential)
+    assert get_indexes(streamed) == get_indexes(sequential)
+    #the shards hold the same sentences in another order, so the same words and tags are indexed
+    whole = SinicaPOS(TinyCorpus(TINY_SENTS))
+    assert sorted(whole.get_compound_dict().words) == sorted(sequential.get_compound_dict().words)
+    assert {word:sorted(tags) for word, tags in whole.get_wordtag_dict().items()} == \
+        {word:sorted(tags) for word, tags in sequential.get_wordtag_dict().items()}
+    assert sorted(whole.get_productivity_list()) == sorted(sequential.get_productivity_list())
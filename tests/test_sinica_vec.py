@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import chinese_roots
+
+def make_vec(corpus, **kwargs):
+    return chinese_roots.SinicaVec(corpus, seed=1, workers=1, vector_size=16, **kwargs)
+
+def cosine(vec, a, b):
+    wv = vec.model.wv
+    return float(np.dot(wv[a], wv[b]) / (np.linalg.norm(wv[a]) * np.linalg.norm(wv[b])))
+
+def test_compound_dict_covers_vocabulary(tiny_corpus):
+    vec = make_vec(tiny_corpus)
+    assert sorted(vec.compound_dict.words) == sorted(vec.model.wv.index_to_key)
+    assert sorted(vec.compound_dict['造']) == ['建造', '製造', '造成']
+
+def test_similarity_list_matches_model(tiny_corpus):
+    vec = make_vec(tiny_corpus)
+    similarity_list = vec.get_compound_similarity_list('建造')
+    words = [word for word, similarity in similarity_list]
+    assert sorted(words) == sorted(set(vec.compound_dict['建']) | set(vec.compound_dict['造']))
+    similarities = [float(similarity) for word, similarity in similarity_list]
+    assert similarities == sorted(similarities, reverse=True)
+    for word, similarity in similarity_list:
+        assert similarity == pytest.approx(cosine(vec, '建造', word), abs=1e-5)
+
+def test_batch_similarity_lists_match_single(tiny_corpus):
+    vec = make_vec(tiny_corpus, result_cache_size=0)
+    queries = ['建造', '學生', '建造']
+    for single, batch in zip([vec.get_compound_similarity_list(query) for query in queries],
+        vec.get_compound_similarity_lists(queries)):
+        assert dict(single).keys() == dict(batch).keys()
+        for word, similarity in batch:
+            assert similarity == pytest.approx(dict(single)[word], abs=1e-6)
+
+def test_avg_similarities_match_per_word_average(tiny_corpus):
+    vec = make_vec(tiny_corpus)
+    avg_sim_dict = vec.get_avg_similarity_dict()
+    for word in vec.compound_dict.words:
+        similarity_list = vec.get_compound_similarity_list(word)
+        expected = sum(float(similarity) for _, similarity in similarity_list) / len(similarity_list)
+        assert avg_sim_dict[word] == pytest.approx(expected, abs=1e-5)
+        assert vec.get_avg_compound_similarity(word) == pytest.approx(expected, abs=1e-5)
+    #min_entries=2 leaves out words that only share roots with themselves
+    most_similar = vec.get_most_similar(2)
+    assert [similarity for word, similarity in most_similar] == sorted(avg_sim_dict[word] for word, _ in most_similar)[::-1]
+    assert {word for word, _ in most_similar} == \
+        {word for word in avg_sim_dict if len(vec.get_compound_similarity_list(word)) >= 2}
+
+def test_parallel_avg_similarities_match(tiny_corpus):
+    vec = make_vec(tiny_corpus)
+    averages, counts = vec.get_avg_similarities(workers=1)
+    vec.avg_similarities = None
+    parallel_averages, parallel_counts = vec.get_avg_similarities(workers=2)
+    assert np.array_equal(counts, parallel_counts)
+    assert np.allclose(averages, parallel_averages)
+
+def test_model_cache_is_memory_mapped(tiny_corpus, tmp_path):
+    trained = make_vec(tiny_corpus, cache_dir=str(tmp_path))
+    cached = make_vec(tiny_corpus, cache_dir=str(tmp_path))
+    assert isinstance(cached.model.wv.vectors, np.memmap)
+    assert np.array_equal(np.asarray(cached.model.wv.vectors), trained.model.wv.vectors)
+    assert [word for word, _ in cached.get_compound_similarity_list('建造')] == \
+        [word for word, _ in trained.get_compound_similarity_list('建造')]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import chinese_roots
+
+NEW_SENTS = [['工人', '建築', '大樓'], ['他們', '建築', '學校'], ['大樓', '很', '高']] * 5
+
+def make_vec(corpus, **kwargs):
+    return chinese_roots.SinicaVec(corpus, seed=1, workers=1, vector_size=16, **kwargs)
+
+def check_update(vec):
+    #fill the similarity index and the result cache before updating
+    before = vec.get_compound_similarity_list('建造')
+    unaffected = vec.get_compound_similarity_list('語言')
+    assert '建築' not in dict(before)
+
+    new_words = vec.update(NEW_SENTS, workers=1)
+    assert set(new_words) == {'建築', '大樓', '很', '高'}
+
+    after = vec.get_compound_similarity_list('建造')
+    assert '建築' in dict(after)
+    #the refreshed index agrees with one rebuilt from the updated model
+    wv = vec.model.wv
+    for word, similarity in after:
+        expected = np.dot(wv[word], wv['建造']) / (np.linalg.norm(wv[word]) * np.linalg.norm(wv['建造']))
+        assert similarity == pytest.approx(float(expected), abs=1e-5)
+    assert sorted(vec.compound_dict['建']) == sorted(word for word in wv.index_to_key if '建' in word)
+    #語言 shares no root with the new sentences, so its cached result was kept
+    hits = vec.result_cache.get_stats()['hits']
+    assert vec.get_compound_similarity_list('語言') == unaffected
+    assert vec.result_cache.get_stats()['hits'] == hits + 1
+    assert vec.result_cache.get_stats()['invalidations'] >= 1
+    assert '建築' in vec.get_avg_similarity_dict()
+
+def test_update_in_memory_model(tiny_corpus):
+    check_update(make_vec(tiny_corpus))
+
+def test_update_cached_model(tiny_corpus, tmp_path):
+    make_vec(tiny_corpus, cache_dir=str(tmp_path))
+    vec = make_vec(tiny_corpus, cache_dir=str(tmp_path))
+    assert isinstance(vec.model.wv.vectors, np.memmap)
+    check_update(vec)
+    assert not isinstance(vec.model.wv.vectors, np.memmap)
+    #the cached copy on disk is unchanged
+    assert '建築' not in make_vec(tiny_corpus, cache_dir=str(tmp_path)).model.wv.key_to_index
+
+def test_update_rejects_one_shot_iterator(tiny_corpus):
+    vec = make_vec(tiny_corpus)
+    with pytest.raises(TypeError):
+        vec.update(iter(NEW_SENTS))
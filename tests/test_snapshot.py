@@ -0,0 +1,70 @@
+import os, shutil, warnings
+
+import pytest
+
+import chinese_roots
+from conftest import FIXTURES
+
+QUERIES = ['而', '而*', '*而', '*而*', '', '*', '好', '*飛']
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / 'cedict.csv')
+    shutil.copy(os.path.join(FIXTURES, 'cedict_small.csv'), path)
+    return path
+
+def assert_same(cdict, other):
+    assert list(other.keys) == list(cdict.keys)
+    assert other.hanzi == cdict.hanzi
+    assert other.max_entry_len == cdict.max_entry_len
+    for query in QUERIES:
+        assert other.search(query) == cdict.search(query)
+    assert other.get_idioms() == cdict.get_idioms()
+    #not stored in the snapshot, but built from its entries on first use
+    assert other.search_definitions('fly') == cdict.search_definitions('fly')
+    assert other.lookup_simp('学习') == cdict.lookup_simp('学习')
+    assert other.search_pinyin('xue *', tones=False) == cdict.search_pinyin('xue *', tones=False)
+
+def test_round_trip(csv_path, tmp_path):
+    cdict = chinese_roots.CDict(csv_path)
+    cdict.save_snapshot(str(tmp_path / 'first.snap'))
+    loaded = chinese_roots.CDict.load_snapshot(str(tmp_path / 'first.snap'))
+    assert_same(cdict, loaded)
+
+    #a loaded snapshot can be saved again, and gives the same file
+    loaded.save_snapshot(str(tmp_path / 'second.snap'))
+    assert_same(cdict, chinese_roots.CDict.load_snapshot(str(tmp_path / 'second.snap'), csv_path))
+    with open(str(tmp_path / 'first.snap'), 'rb') as first, open(str(tmp_path / 'second.snap'), 'rb') as second:
+        assert first.read() == second.read()
+
+def test_stale_snapshot(csv_path, tmp_path):
+    snapshot = str(tmp_path / 'cedict.snap')
+    chinese_roots.CDict(csv_path).save_snapshot(snapshot)
+    with open(csv_path, 'a', encoding='utf-8') as f:
+        f.write('龍,龙,long2,dragon\n')
+    with pytest.raises(ValueError):
+        chinese_roots.CDict.load_snapshot(snapshot)
+
+def test_changed_since_loaded(csv_path, tmp_path):
+    cdict = chinese_roots.CDict(csv_path)
+    with open(csv_path, 'a', encoding='utf-8') as f:
+        f.write('龍,龙,long2,dragon\n')
+    with pytest.raises(ValueError):
+        cdict.save_snapshot(str(tmp_path / 'cedict.snap'))
+
+def test_touched_but_unchanged(csv_path, tmp_path):
+    snapshot = str(tmp_path / 'cedict.snap')
+    cdict = chinese_roots.CDict(csv_path)
+    cdict.save_snapshot(snapshot)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    with pytest.warns(UserWarning, match='save snapshot'):
+        loaded = chinese_roots.CDict.load_snapshot(snapshot)
+    assert_same(cdict, loaded)
+
+    #saving again records the new modification time, so the next load doesn't hash the CSV
+    loaded.save_snapshot(snapshot)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert_same(cdict, chinese_roots.CDict.load_snapshot(snapshot))